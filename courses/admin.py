@@ -7,7 +7,7 @@ admin.site.index_template = 'memcache_status/admin_index.html'
 # @admin.register() is registering models in the admin site
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
-    list_display = ['title', 'slug']
+    list_display = ['title', 'slug', 'total_courses']
     prepopulated_fields = {'slug': ('title',)}
 
 
@@ -17,7 +17,7 @@ class ModuleInline(admin.StackedInline):
 # @admin.register() is registering models in the admin site
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ['title', 'subject', 'created']
+    list_display = ['title', 'subject', 'created', 'total_modules', 'total_students']
     list_filter = ['created', 'subject']
     search_fields = ['title', 'overview']
     prepopulated_fields = {'slug': ('title',)}
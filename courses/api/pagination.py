@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+# cursor pagination walks the (created, id) index, so every page costs the same
+class CoursePagination(CursorPagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    ordering = ('-created', '-id')
+
+
+class SearchPagination(PageNumberPagination):
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
@@ -1,7 +1,15 @@
 from rest_framework.permissions import BasePermission
+from ..caching import is_enrolled
 
 # This will check if the user performing the request 
 # is present in the students relationship of the Course object.
 class IsEnrolled(BasePermission):
     def has_object_permission(self, request, view, obj):
-        return obj.students.filter(id=request.user.id).exists()
+        # enrolled course ids are cached per user
+        return is_enrolled(request.user, obj.id)
+
+
+# This will check if the user performing the request is the owner of the Course object.
+class IsCourseOwner(BasePermission):
+    def has_object_permission(self, request, view, obj):
+        return obj.owner_id == request.user.id
@@ -51,4 +51,14 @@ class CourseWithContentsSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Course
-        fields = ['id', 'subject', 'title', 'slug', 'overview', 'created', 'owner', 'modules']
\ No newline at end of file
+        fields = ['id', 'subject', 'title', 'slug', 'overview', 'created', 'owner', 'modules']
+
+
+# a ranked hit of the search index
+class SearchResultSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    id = serializers.IntegerField()
+    course = serializers.IntegerField()
+    title = serializers.CharField()
+    snippet = serializers.CharField()
+    score = serializers.FloatField()
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework import routers
 from . import views
@@ -11,6 +12,16 @@ router.register('courses', views.CourseViewSet)
 urlpatterns = [
      path('subjects/', views.SubjectListView.as_view(), name='subject_list'),
      path('subjects/<pk>/', views.SubjectDetailView.as_view(), name='subject_detail'),
+     path('search/', views.SearchView.as_view(), name='search'),
      # path('courses/<pk>/enroll/', views.CourseEnrollView.as_view(), name='course_enroll'),
      path('', include(router.urls)),
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_VIEWS:
+    from .. import async_views
+    # matched before the router, the other actions are still served by the viewset
+    urlpatterns = [
+        path('courses/', async_views.api_course_list, name='course-list'),
+        path('courses/<pk>/', async_views.api_course_detail, name='course-detail'),
+        path('courses/<pk>/contents/', async_views.api_course_contents, name='course-contents'),
+    ] + urlpatterns
\ No newline at end of file
@@ -1,16 +1,32 @@
+import io
 from rest_framework import generics
-from ..models import Subject, Course
-from .serializers import SubjectSerializer, CourseSerializer, CourseWithContentsSerializer
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
+from django.views.decorators.cache import never_cache
+from educa import instrumentation
+from educa.routers import primary, replica_reads
+from ..models import Subject, Course, Content
+from .serializers import SubjectSerializer, CourseSerializer, CourseWithContentsSerializer, \
+    SearchResultSerializer
 from django.shortcuts import get_object_or_404
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.authentication import BasicAuthentication
-from rest_framework.permissions import IsAuthenticated
-from rest_framework import viewsets
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework import viewsets, status
 from rest_framework.decorators import action
-from .permissions import IsEnrolled
+from ..caching import course_version_key, get_version, is_enrolled, get_enrolled_course_ids
+from ..search import get_backend
+from ..enrollment import bulk_enroll, read_usernames
+from .permissions import IsEnrolled, IsCourseOwner
+from .pagination import CoursePagination, SearchPagination
 
 
+@method_decorator(replica_reads, name='dispatch')
 class SubjectListView(generics.ListAPIView):
     # retrieves objects
     queryset = Subject.objects.all()
@@ -18,11 +34,29 @@ class SubjectListView(generics.ListAPIView):
     serializer_class = SubjectSerializer
 
 
+@method_decorator(replica_reads, name='dispatch')
 class SubjectDetailView(generics.RetrieveAPIView):
     # retrieves objects
     queryset = Subject.objects.all()
     # serializes objects
     serializer_class = SubjectSerializer
+
+# ranked full-text search over courses, modules and the text contents of enrolled courses.
+# Results depend on the user, so they are kept out of the site-wide cache
+@method_decorator(never_cache, name='dispatch')
+class SearchView(generics.GenericAPIView):
+    permission_classes = [AllowAny]
+    serializer_class = SearchResultSerializer
+    pagination_class = SearchPagination
+
+    def get(self, request, format=None):
+        # text contents are only searchable by the students enrolled on their course
+        results = get_backend().search(request.query_params.get('q', ''),
+                                       text_course_ids=get_enrolled_course_ids(request.user))
+        page = self.paginate_queryset(results)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
 """
 # this will handle student enrolement on course.
 class CourseEnrollView(APIView):
@@ -41,9 +75,32 @@ class CourseEnrollView(APIView):
         return Response({'enrolled': True})"""
 
 
+@method_decorator(replica_reads, name='dispatch')
 class CourseViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Course.objects.all()
+    # modules of all the courses of a page are loaded in one query
+    queryset = Course.objects.prefetch_related('modules')
     serializer_class = CourseSerializer
+    pagination_class = CoursePagination
+    # the budget of the actions that declare one, see educa.instrumentation
+    query_budget = None
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        if self.action == 'contents':
+            # load modules, contents and their items in a fixed number of queries
+            qs = qs.prefetch_related(
+                Prefetch('modules__contents', queryset=Content.objects.with_items()))
+        return qs
+
+    # session, user, the courses of the page and their modules
+    @instrumentation.query_budget(4)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    # session, user, the course and its modules
+    @instrumentation.query_budget(4)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     # action decorator with parameter detail=True to specify 
     # that this is an action to be performed on a single object.
     @action(detail=True,
@@ -54,13 +111,64 @@ class CourseViewSet(viewsets.ReadOnlyModelViewSet):
         course = self.get_object()
         course.students.add(request.user)
         return Response({'enrolled': True})
+    # the course owner enrolls (POST) or unenrolls (DELETE) many users at once,
+    # either from a JSON list of usernames or from an uploaded CSV file with a username column
+    @action(detail=True,
+            methods=['post', 'delete'],
+            url_path='students',
+            authentication_classes=[BasicAuthentication],
+            permission_classes=[IsAuthenticated, IsCourseOwner])
+    def bulk_enroll(self, request, *args, **kwargs):
+        course = self.get_object()
+        if 'file' in request.FILES:
+            # read the CSV lazily, line by line
+            usernames = read_usernames(io.TextIOWrapper(request.FILES['file'], encoding='utf-8'))
+        else:
+            usernames = request.data.get('usernames')
+            if not isinstance(usernames, list):
+                return Response({'errors': ['Send a list of usernames or a CSV file.']},
+                                status=status.HTTP_400_BAD_REQUEST)
+        unenroll = request.method == 'DELETE'
+        batches = list(bulk_enroll(course, usernames, settings.BULK_ENROLL_CHUNK_SIZE, unenroll=unenroll))
+        return Response({
+            'unenrolled' if unenroll else 'enrolled': sum(batch['changed'] for batch in batches),
+            'missing': [username for batch in batches for username in batch['missing']],
+            'batches': batches,
+        })
     # this will perform action on a single object
     # only GET is allowed, and only users enrolled on course can access its content
     @action(detail=True,
             methods=['get'],
             serializer_class=CourseWithContentsSerializer,
             authentication_classes=[BasicAuthentication],
-            permission_classes=[IsAuthenticated, IsEnrolled])
+            permission_classes=[IsAuthenticated, IsEnrolled],
+            # user, enrollments, course, modules and contents,
+            # then the items and content type of each of the 4 item models
+            query_budget=14)
     def contents(self, request, *args, **kwargs):
-        # returns the course object
-        return self.retrieve(request, *args, **kwargs)
\ No newline at end of file
+        try:
+            course_id = int(kwargs[self.lookup_field])
+        except ValueError:
+            raise Http404
+        # the cached enrollment check is all that is needed for unchanged courses
+        if not is_enrolled(request.user, course_id):
+            # let get_object() answer with 404 for unknown courses or 403 for other users
+            self.get_object()
+        # the course version changes whenever its modules, contents or items change
+        version = get_version(course_version_key(course_id))
+        etag = f'"{course_id}-{version}"'
+        # private keeps the site-wide cache middleware from sharing the payload between users,
+        # no-cache makes clients revalidate it with If-None-Match
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in etags or '*' in etags:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        key = f'course_{course_id}_contents_{version}'
+        data = cache.get(key)
+        if data is None:
+            # serialize the course object with its modules and rendered contents,
+            # read from the primary since the payload is cached under the current version
+            with primary():
+                data = self.get_serializer(self.get_object()).data
+            cache.set(key, data, settings.COURSE_CONTENTS_CACHE_TIMEOUT)
+        return Response(data, headers=headers)
\ No newline at end of file
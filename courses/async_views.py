@@ -0,0 +1,78 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from educa.instrumentation import query_budget
+from educa.routers import primary, replica_reads
+from .views import CourseListView, CourseDetailView
+from .api.views import CourseViewSet
+
+# Async versions of the read-heavy endpoints, routed instead of the sync ones when
+# settings.ASYNC_VIEWS is on (the default under educa.asgi). The ORM and cache calls are
+# still synchronous, so they run in worker threads and the event loop keeps serving other
+# requests meanwhile.
+# sync_to_async() would run them on the one thread the Django 3.1 handler runs all the
+# thread-sensitive code of the process on, serving these requests one at a time like the sync
+# views. They run in the threads of the event loop's pool instead, see run_sync().
+# The middleware and the rest of the handler still use that one thread, keep their work short
+
+
+# runs func in a thread of the pool, with settings.ASYNC_VIEWS_THREAD_SENSITIVE on the
+# shared thread. Pool threads keep their own database connections, so they are closed
+# once obsolete (see CONN_MAX_AGE) like at the start and end of a request.
+# Template responses are rendered in the same thread instead of by the handler, from the
+# primary database like the handler would
+def run_sync(func):
+    if settings.ASYNC_VIEWS_THREAD_SENSITIVE:
+        return sync_to_async(func)
+
+    def in_worker(*args, **kwargs):
+        close_old_connections()
+        try:
+            response = func(*args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                with primary():
+                    response.render()
+            return response
+        finally:
+            close_old_connections()
+    return sync_to_async(in_worker, thread_sensitive=False)
+
+
+# runs a class-based view in a worker thread, using all of its code unchanged. It goes through
+# dispatch(), so the view's decorators apply and methods it doesn't handle get a 405
+async def run_view(view_class, request, *args, **kwargs):
+    view = view_class()
+    view.setup(request, *args, **kwargs)
+    return await run_sync(view.dispatch)(request, *args, **kwargs)
+
+
+@replica_reads
+async def course_list(request, subject=None):
+    return await run_view(CourseListView, request, subject=subject)
+
+
+@replica_reads
+async def course_detail(request, slug):
+    return await run_view(CourseDetailView, request, slug=slug)
+
+
+# the REST framework views are synchronous, they run as a whole in a worker thread.
+# CourseViewSet.dispatch already reads from the replicas
+api_course_list_view = CourseViewSet.as_view({'get': 'list'})
+api_course_detail_view = CourseViewSet.as_view({'get': 'retrieve'})
+api_course_contents_view = CourseViewSet.as_view({'get': 'contents'}, **CourseViewSet.contents.kwargs)
+
+
+@query_budget(CourseViewSet.list.query_budget)
+async def api_course_list(request):
+    return await run_sync(api_course_list_view)(request)
+
+
+@query_budget(CourseViewSet.retrieve.query_budget)
+async def api_course_detail(request, pk):
+    return await run_sync(api_course_detail_view)(request, pk=pk)
+
+
+@query_budget(CourseViewSet.contents.kwargs['query_budget'])
+async def api_course_contents(request, pk):
+    return await run_sync(api_course_contents_view)(request, pk=pk)
@@ -0,0 +1,40 @@
+from django.db import connections, router, transaction
+from django.db.models import Max
+
+
+# bulk_create() that sets the primary keys of the created objects on every database, so
+# rows referencing them can be bulk created next. SQLite cannot return the ids of inserted
+# rows, so they are reserved beforehand, see reserve_sqlite_pks()
+def bulk_create_with_pks(objs, batch_size=None):
+    objs = list(objs)
+    if not objs:
+        return objs
+    model = type(objs[0])
+    db = router.db_for_write(model)
+    manager = model._default_manager.db_manager(db)
+    connection = connections[db]
+    if connection.features.can_return_rows_from_bulk_insert:
+        return manager.bulk_create(objs, batch_size=batch_size)
+    with transaction.atomic(using=db):
+        if connection.vendor == 'sqlite':
+            start = reserve_sqlite_pks(connection, model, len(objs))
+        else:
+            start = (manager.aggregate(last=Max('pk'))['last'] or 0) + 1
+        for pk, obj in enumerate(objs, start):
+            obj.pk = pk
+        return manager.bulk_create(objs, batch_size=batch_size)
+
+
+# reserves count ids of an AUTOINCREMENT table and returns the first one. They are taken from
+# sqlite_sequence, which keeps the highest id ever used, so the ids of deleted rows are never
+# given out again. Its update is the first statement, so the write lock is held before the
+# last id is read, and rows inserted meanwhile by other connections get ids past the reserved ones
+def reserve_sqlite_pks(connection, model, count):
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE sqlite_sequence SET seq = seq + %s WHERE name = %s', [count, table])
+        if not cursor.rowcount:
+            # nothing was ever inserted in the table
+            cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, count])
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+        return cursor.fetchone()[0] - count + 1
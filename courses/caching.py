@@ -0,0 +1,110 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from educa.routers import primary
+from .models import Course
+
+# bumped every time a subject, course or module changes
+CATALOG_VERSION_KEY = 'catalog_version'
+
+
+# bumped every time the course, its modules, contents, items or their order change
+def course_version_key(course_id):
+    return f'course_{course_id}_version'
+
+
+# bumped every time a content of the module, one of their items or their order change
+def module_version_key(module_id):
+    return f'module_{module_id}_contents_version'
+
+
+# ids of the courses a user is enrolled on, kept current by the m2m_changed handler
+def enrollment_key(user_id):
+    return f'user_{user_id}_courses_joined'
+
+
+# drops the cached enrolled courses of users once the transaction changing their
+# enrollments is committed, for the same reason as bump_version()
+def forget_enrollments(user_ids):
+    keys = [enrollment_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_enrolled_course_ids(user):
+    if not user.is_authenticated:
+        return frozenset()
+    key = enrollment_key(user.id)
+    course_ids = cache.get(key)
+    if course_ids is None:
+        # cached until the enrollments change, so never read from a lagging replica
+        with primary():
+            course_ids = frozenset(Course.students.through.objects.filter(user_id=user.id)
+                                   .values_list('course_id', flat=True))
+        cache.set(key, course_ids, settings.ENROLLMENT_CACHE_TIMEOUT)
+    return course_ids
+
+
+def is_enrolled(user, course_id):
+    try:
+        return int(course_id) in get_enrolled_course_ids(user)
+    except (TypeError, ValueError):
+        return False
+
+
+# returns the current value of a version key, creating it when it is missing
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # start from the current time, so that an evicted version never repeats an old value
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+# invalidates every value cached under the previous version of a key, once the current
+# transaction is committed. Bumped before, a concurrent request could still read the rows
+# being changed and cache them under the new version until it times out
+def bump_version(key):
+    def bump():
+        try:
+            cache.incr(key)
+        except ValueError:
+            # the version was never set or has been evicted
+            get_version(key)
+
+    transaction.on_commit(bump)
+
+
+# starts versions over, e.g. for rows created by bulk inserts, whose ids may have been used by deleted
+# rows before. get_version() restarts them from the current time, past any value they had.
+# Like bump_version(), it waits for the transaction creating the rows to be committed
+def reset_versions(keys):
+    keys = list(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+# returns the value cached under key for the given version, calling build() to compute it
+# when it is missing. Values are stored as (version, refresh_at, value) and kept past their
+# refresh time, so when a popular key goes stale only the process holding the lock
+# rebuilds it while the others keep serving the stale value.
+# Values are built from the primary database, a replica could still hold the previous version
+def get_or_build(key, version, build, timeout=None):
+    if timeout is None:
+        timeout = settings.CATALOG_CACHE_TIMEOUT
+    entry = cache.get(key)
+    if entry is not None:
+        entry_version, refresh_at, value = entry
+        if entry_version == version and refresh_at > time.time():
+            return value
+        if not cache.add(f'{key}:lock', 1, settings.CATALOG_CACHE_LOCK_TIMEOUT):
+            return value
+    try:
+        with primary():
+            value = build()
+        cache.set(key, (version, time.time() + timeout, value), settings.CATALOG_CACHE_STALE_TIMEOUT)
+    finally:
+        # a failed build leaves the next request to try again
+        cache.delete(f'{key}:lock')
+    return value
@@ -0,0 +1,32 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import Subject, Course, Module
+
+
+# correlated COUNT(*) subquery, usable in a single UPDATE of the counter column
+def count_subquery(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field) \
+        .annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+# adds delta to a counter column of the rows with the given ids, without reading them
+def increment(model, ids, field, delta=1):
+    model.objects.filter(pk__in=ids).update(**{field: F(field) + delta})
+
+
+# recomputes the counters of the given subjects, or of all of them, in one statement
+def recount_subjects(subject_ids=None):
+    subjects = Subject.objects.all() if subject_ids is None else Subject.objects.filter(pk__in=subject_ids)
+    return subjects.update(total_courses=count_subquery(Course.objects.all(), 'subject'))
+
+
+# recomputes the counters of the given courses, or of all of them, in one statement
+def recount_courses(course_ids=None, modules=True, students=True):
+    courses = Course.objects.all() if course_ids is None else Course.objects.filter(pk__in=course_ids)
+    counters = {}
+    if modules:
+        counters['total_modules'] = count_subquery(Module.objects.all(), 'course')
+    if students:
+        counters['total_students'] = count_subquery(Course.students.through.objects.all(), 'course')
+    return courses.update(**counters)
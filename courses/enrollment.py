@@ -0,0 +1,58 @@
+import csv
+import time
+from itertools import islice
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed
+from .models import Course
+
+
+# usernames from the first column of a CSV stream, skipping blank lines and a "username" header
+def read_usernames(lines):
+    for row in csv.reader(lines):
+        if row and row[0].strip() and row[0].strip().lower() != 'username':
+            yield row[0].strip()
+
+
+# enrolls (or unenrolls) the users with the given usernames on a course, writing the
+# students through table in chunks of chunk_size rows. Yields the stats of every batch
+def bulk_enroll(course, usernames, chunk_size=1000, unenroll=False):
+    Through = Course.students.through
+    usernames = iter(usernames)
+    action = 'remove' if unenroll else 'add'
+    batch = 0
+    while True:
+        chunk = list(islice(usernames, chunk_size))
+        if not chunk:
+            break
+        batch += 1
+        start = time.perf_counter()
+        user_ids = dict(User.objects.filter(username__in=chunk).values_list('username', 'id'))
+        with transaction.atomic():
+            # only the rows to insert or delete, like students.add() and remove() do
+            enrolled = set(Through.objects.filter(course_id=course.id, user_id__in=user_ids.values())
+                           .values_list('user_id', flat=True))
+            pk_set = enrolled if unenroll else set(user_ids.values()) - enrolled
+            if pk_set:
+                # bulk writes skip the m2m_changed signal of students.add() and remove(),
+                # send it here so that the enrollment cache and counters stay current
+                m2m_changed.send(sender=Through, action=f'pre_{action}', instance=course, reverse=False,
+                                 model=User, pk_set=pk_set, using=Through.objects.db)
+                if unenroll:
+                    Through.objects.filter(course_id=course.id, user_id__in=pk_set).delete()
+                else:
+                    # ignore_conflicts in case a concurrent request enrolled some of them meanwhile
+                    Through.objects.bulk_create([Through(course_id=course.id, user_id=user_id)
+                                                 for user_id in pk_set], ignore_conflicts=True)
+                m2m_changed.send(sender=Through, action=f'post_{action}', instance=course, reverse=False,
+                                 model=User, pk_set=pk_set, using=Through.objects.db)
+        seconds = time.perf_counter() - start
+        yield {
+            'batch': batch,
+            'users': len(user_ids),
+            'changed': len(pk_set),
+            'missing': [username for username in chunk if username not in user_ids],
+            'seconds': round(seconds, 4),
+            # rows written, not usernames read
+            'rows_per_second': round(len(pk_set) / seconds) if seconds else None,
+        }
@@ -1,31 +1,66 @@
-from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import F, Subquery
+from django.db.models.functions import Coalesce, Greatest
 
 
 class OrderField(models.PositiveIntegerField):
     def __init__(self, for_fields=None, *args, **kwargs):
         self.for_fields = for_fields
         super().__init__(*args, **kwargs)
+
+    # values of the for_fields of the model instance, e.g. {'course_id': 1}
+    def get_scope(self, model_instance):
+        scope = {}
+        for field in self.for_fields or []:
+            attname = self.model._meta.get_field(field).attname
+            scope[attname] = getattr(model_instance, attname)
+        return scope
+
+    # name of the sequence row that holds the next free order of a scope,
+    # e.g. 'courses.module.order:course_id=1'
+    def get_scope_key(self, scope):
+        values = ','.join(f'{name}={value}' for name, value in sorted(scope.items()))
+        return f'{self.model._meta.label_lower}.{self.attname}:{values}'
+
+    # reserves count consecutive orders for the given scope and returns the first one.
+    # The sequence row is incremented with a single UPDATE, which locks it until the
+    # transaction commits, so concurrent writers never get the same order
+    def allocate(self, scope, count=1):
+        OrderSequence = apps.get_model('courses', 'OrderSequence')
+        key = self.get_scope_key(scope)
+        sequence = OrderSequence.objects.filter(scope=key)
+        # the sequence never falls behind the highest stored order, rows saved with an explicit
+        # order or moved by reorder() can be past it
+        last = self.model._default_manager.filter(**scope).order_by(f'-{self.attname}').values(self.attname)[:1]
+        next_value = Greatest(F('value'), Coalesce(Subquery(last) + 1, 0),
+                              output_field=models.PositiveIntegerField()) + count
+        with transaction.atomic():
+            if not sequence.update(value=next_value):
+                # first allocation in this scope
+                OrderSequence.objects.get_or_create(scope=key)
+                sequence.update(value=next_value)
+            value = sequence.values_list('value', flat=True).get()
+        return value - count
+
+    # assigns orders to all the instances without one, reserving a block per scope.
+    # This is used by bulk_create(), which never calls pre_save()
+    def allocate_many(self, model_instances):
+        scopes = {}
+        for instance in model_instances:
+            if getattr(instance, self.attname) is None:
+                scope = self.get_scope(instance)
+                scopes.setdefault(self.get_scope_key(scope), (scope, []))[1].append(instance)
+        for scope, instances in scopes.values():
+            first = self.allocate(scope, len(instances))
+            for value, instance in enumerate(instances, start=first):
+                setattr(instance, self.attname, value)
+
     # check if the value exists for this field in the model instance
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
-            # if there is no current value
-            try:
-                # builds a querySet to retrieve all objects for the fields model
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    # if there are any field names in the for_fields attribute of the field,
-                    # calculates the order with respect to the given fields
-                    query = {field: getattr(model_instance, field)\
-                    for field in self.for_fields}
-                    qs = qs.filter(**query)
-                # retrieve the object with the highest order, order of the last item
-                last_item = qs.latest(self.attname)
-                # when object is found, add 1 to the highest order found
-                value = last_item.order + 1
-            # object is not found, assumes it is the first one and assign the order 0 to it
-            except ObjectDoesNotExist:
-                value = 0
+            # if there is no current value, reserve the next order of the scope
+            value = self.allocate(self.get_scope(model_instance))
             # assign the calculated order to the fields value in the model instance and return it
             setattr(model_instance, self.attname, value)
             return value
@@ -12,4 +12,10 @@ ModuleFormSet = inlineformset_factory(
     extra=2,
     # Boolean field in the form of checkbox input. Marks the objects for delete
     can_delete=True
-)
\ No newline at end of file
+)
+
+# title and slug of the copy made by CourseCloneView, the slug must be unique like any course's
+class CourseCloneForm(forms.ModelForm):
+    class Meta:
+        model = Course
+        fields = ['title', 'slug']
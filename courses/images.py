@@ -0,0 +1,86 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+# the process pool is created on first use, so web workers that never upload images don't start one.
+# Its processes are spawned, not forked: a fork of a web worker would inherit its threads' locks
+# and its open database connections
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_VARIANT_WORKERS,
+                                        mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+# runs in a worker process: saves a resized, web-optimized JPEG next to the original for
+# every width smaller than the image, e.g. images/photo.w320.jpg, and returns the variants.
+# Files are read and written through the storage of the image, which is passed pickled
+def generate_variants(storage, name, widths, quality):
+    from PIL import Image as PILImage
+    from .storage import DerivedContentFile
+
+    root = os.path.splitext(name)[0]
+    variants = {'source': name, 'widths': {}}
+    with storage.open(name) as f, PILImage.open(f) as original:
+        variants['width'], variants['height'] = original.size
+        image = original.convert('RGB')
+        for width in sorted(widths):
+            if width >= original.width:
+                break
+            height = round(original.height * width / original.width)
+            output = io.BytesIO()
+            image.resize((width, height), PILImage.LANCZOS).save(output, 'JPEG', quality=quality,
+                                                                 optimize=True, progressive=True)
+            variant_name = f'{root}.w{width}.jpg'
+            # regenerated variants replace the previous ones instead of being saved under another name
+            storage.delete(variant_name)
+            variants['widths'][str(width)] = storage.save(variant_name, DerivedContentFile(output.getvalue()))
+    return variants
+
+
+# called in a thread of the main process when a worker is done
+def save_variants(image_id, future):
+    from .models import Image
+
+    try:
+        variants = future.result()
+    except Exception:
+        logger.exception('Could not generate the variants of image %s', image_id)
+        return
+    try:
+        image = Image.objects.filter(pk=image_id, file=variants['source']).first()
+        # skip images that were deleted or replaced by another file in the meantime
+        if image is not None:
+            image.set_variants(variants)
+            # saving changes the updated time, which refreshes the cached renders of the image
+            image.save(update_fields=['variants', 'updated'])
+    finally:
+        # the thread has its own database connection
+        connection.close()
+
+
+# generates the variants of an image in the process pool once its transaction is committed,
+# so the request that uploaded the image never waits for them
+def schedule_variants(image):
+    storage, name = image.file.storage, image.file.name
+    image_id = image.pk
+
+    def submit():
+        future = get_executor().submit(generate_variants, storage, name,
+                                       settings.IMAGE_VARIANT_WIDTHS, settings.IMAGE_VARIANT_QUALITY)
+        # save them from a new thread, never from the thread that runs the callback
+        future.add_done_callback(
+            lambda future: threading.Thread(target=save_variants, args=(image_id, future)).start())
+
+    transaction.on_commit(submit)
@@ -0,0 +1,49 @@
+import base64
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Measures requests/sec of a running server, e.g. compare '
+            '"gunicorn educa.wsgi -w 4" with "uvicorn educa.asgi:application --workers 4" '
+            'by running this command against each of them')
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', help='e.g. http://127.0.0.1:8000')
+        parser.add_argument('paths', nargs='+', help='paths to request, e.g. / /api/courses/')
+        parser.add_argument('--requests', type=int, default=500, help='requests per path')
+        parser.add_argument('--concurrency', type=int, default=16, help='parallel clients')
+        parser.add_argument('--auth', help='username:password sent with HTTP basic authentication')
+
+    def handle(self, *args, **options):
+        headers = {}
+        if options['auth']:
+            headers['Authorization'] = 'Basic ' + base64.b64encode(options['auth'].encode()).decode()
+        for path in options['paths']:
+            url = options['base_url'].rstrip('/') + path
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                results = list(executor.map(lambda _: self.request(url, headers), range(options['requests'])))
+            elapsed = time.perf_counter() - start
+            latencies = sorted(latency for latency, ok in results)
+            errors = sum(1 for latency, ok in results if not ok)
+            if errors == len(results):
+                raise CommandError(f'Every request to {url} failed.')
+            self.stdout.write(
+                f'{path}: {len(results) / elapsed:.1f} req/s, '
+                f'p50 {statistics.median(latencies) * 1000:.1f} ms, '
+                f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms, {errors} errors')
+
+    def request(self, url, headers):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                response.read()
+                ok = response.status < 400
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - start, ok
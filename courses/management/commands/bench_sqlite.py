@@ -0,0 +1,102 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction, OperationalError
+from django.db.models import F
+from courses.models import Subject, Course
+
+# a configuration with the stock backend and none of the tuning, as the project used to run
+STOCK_DATABASE = {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}}
+
+
+class Command(BaseCommand):
+    help = ('Compares the read and write throughput of concurrent threads on a scratch copy of the '
+            'schema, using the stock SQLite backend and then the tuned one from settings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='threads browsing the catalog')
+        parser.add_argument('--writers', type=int, default=4, help='threads enrolling students')
+        parser.add_argument('--seconds', type=float, default=5, help='duration of each run')
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--users', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        tuned = settings.DATABASES['default']
+        configs = [('stock', STOCK_DATABASE),
+                   ('tuned', {'ENGINE': tuned['ENGINE'], 'OPTIONS': tuned.get('OPTIONS', {})})]
+        with tempfile.TemporaryDirectory() as directory:
+            for label, config in configs:
+                alias = f'bench_{label}'
+                connections.databases[alias] = {**config, 'NAME': os.path.join(directory, f'{alias}.sqlite3')}
+                self.setup_database(alias, options)
+                stats = self.run(alias, options)
+                connections[alias].close()
+                self.stdout.write(
+                    f"{label}: {stats['reads'] / options['seconds']:.0f} reads/s, "
+                    f"{stats['writes'] / options['seconds']:.0f} writes/s, "
+                    f"{stats['locked']} 'database is locked' errors")
+
+    def setup_database(self, alias, options):
+        call_command('migrate', database=alias, verbosity=0)
+        owner = User.objects.using(alias).create(username='owner')
+        subject = Subject.objects.using(alias).create(title='Subject', slug='subject')
+        Course.objects.using(alias).bulk_create(
+            Course(owner=owner, subject=subject, title=f'Course {i}', slug=f'course-{i}', overview='')
+            for i in range(options['courses']))
+        User.objects.using(alias).bulk_create(User(username=f'user-{i}') for i in range(options['users']))
+
+    def run(self, alias, options):
+        course_ids = list(Course.objects.using(alias).values_list('id', flat=True))
+        user_ids = list(User.objects.using(alias).values_list('id', flat=True))
+        stats = {'reads': 0, 'writes': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def count(key):
+            with lock:
+                stats[key] += 1
+
+        # a catalog page: a page of courses and a detail lookup
+        def read():
+            list(Course.objects.using(alias).order_by('-created', '-id')
+                 .values('id', 'title', 'slug', 'total_modules')[:20])
+            Course.objects.using(alias).get(id=random.choice(course_ids))
+
+        # an enrollment: read the course, add the student and update its counter in one transaction
+        def write():
+            course_id, user_id = random.choice(course_ids), random.choice(user_ids)
+            with transaction.atomic(using=alias):
+                Course.objects.using(alias).get(id=course_id)
+                through = Course.students.through.objects.using(alias)
+                if not through.filter(course_id=course_id, user_id=user_id).exists():
+                    through.create(course_id=course_id, user_id=user_id)
+                    Course.objects.using(alias).filter(id=course_id).update(total_students=F('total_students') + 1)
+
+        def worker(operation, key):
+            try:
+                while time.perf_counter() < deadline:
+                    try:
+                        operation()
+                    except OperationalError as e:
+                        if 'locked' not in str(e):
+                            raise
+                        count('locked')
+                    else:
+                        count(key)
+            finally:
+                # every thread has its own connection
+                connections[alias].close()
+
+        threads = [threading.Thread(target=worker, args=(read, 'reads')) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=(write, 'writes')) for _ in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return stats
@@ -0,0 +1,173 @@
+import base64
+import json
+import os
+import statistics
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLResolver, get_resolver, reverse
+from django.views.generic.base import TemplateResponseMixin
+from courses.models import Course, Content, Text, Image
+from courses.caching import enrollment_key
+
+# views with side effects on GET, the admin site is skipped as a whole
+SKIPPED_URLS = {'logout'}
+
+
+class Command(BaseCommand):
+    help = ('Requests every GET URL of the project with sample objects of the database (see generate_data) '
+            'and records the query count and response time of a cold request and of warm ones. '
+            'Clears the cache, run it against a benchmark database. Changes made by the run are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='warm requests to each URL')
+        parser.add_argument('--output', help='file to save the results to, as JSON')
+        parser.add_argument('--baseline', default=os.path.join(settings.BASE_DIR, 'benchmarks', 'baseline.json'),
+                            help='results to compare with, "" to skip the comparison')
+        parser.add_argument('--time-tolerance', type=float,
+                            help='also fail when a warm request gets slower than the baseline by this '
+                                 'fraction, e.g. 0.25. Times depend on the machine, only queries are compared by default')
+
+    def handle(self, *args, **options):
+        course = Course.objects.filter(modules__contents__isnull=False).order_by('id').first()
+        if course is None:
+            raise CommandError('No course with contents, run generate_data first.')
+        user = course.owner
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            try:
+                results = self.run(course, user, options['repeat'])
+            finally:
+                # nothing done by the benchmark is kept
+                transaction.set_rollback(True)
+                cache.delete(enrollment_key(user.id))
+        report = {
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'dataset': {'courses': Course.objects.count(), 'contents': Content.objects.count(),
+                        'students': User.objects.filter(courses_joined__isnull=False).distinct().count()},
+            'results': results,
+        }
+        for name, result in results.items():
+            self.stdout.write(f"{name:40} {result.get('status', ''):>4} "
+                              + (result['skipped'] if 'skipped' in result else
+                                 f"queries {result['queries_cold']:>3} cold {result['queries_warm']:>3} warm, "
+                                 f"{result['ms_cold']:8.1f} ms cold {result['ms_warm']:8.1f} ms warm"))
+        # read before the output is written, which may replace the baseline
+        baseline = self.load_baseline(options['baseline']) if options['baseline'] else None
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        if baseline is not None:
+            self.compare(results, baseline, options['baseline'], options['time_tolerance'])
+
+    # URL names with their pattern, e.g. ('api:course-detail', pattern)
+    def get_patterns(self, patterns=None, namespace=None):
+        if patterns is None:
+            patterns = get_resolver().url_patterns
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                if pattern.namespace != 'admin':
+                    inner = ':'.join(filter(None, [namespace, pattern.namespace])) or None
+                    yield from self.get_patterns(pattern.url_patterns, inner)
+            elif pattern.name:
+                yield ':'.join(filter(None, [namespace, pattern.name])), pattern
+
+    # whether the view of a pattern answers GET requests
+    def allows_get(self, callback):
+        if hasattr(callback, 'actions'):
+            # REST framework viewsets
+            return 'get' in callback.actions
+        view_class = getattr(callback, 'view_class', getattr(callback, 'cls', None))
+        if view_class is None:
+            return True
+        # e.g. form views only posted to, which have no template to render on GET
+        if issubclass(view_class, TemplateResponseMixin) and view_class.template_name is None \
+                and view_class.get_template_names is TemplateResponseMixin.get_template_names:
+            return False
+        return hasattr(view_class, 'get')
+
+    # values of the URL arguments, from the benchmarked course
+    def get_samples(self, course):
+        module = course.modules.filter(contents__isnull=False).first()
+        contents = Content.objects.filter(module__course=course)
+        text_content = contents.filter(content_type=ContentType.objects.get_for_model(Text)).first()
+        image_content = contents.filter(content_type=ContentType.objects.get_for_model(Image)).first()
+        samples = {'pk': course.id, 'slug': course.slug, 'subject': course.subject.slug, 'module_id': module.id,
+                   'model_name': 'text'}
+        if text_content:
+            samples.update(module_id=text_content.module_id, id=text_content.object_id)
+        if image_content:
+            samples['path'] = image_content.item.file.name
+        return samples
+
+    def run(self, course, user, repeat):
+        # the owner of the course can see every page once they are also staff, a superuser and a student of it
+        user.is_superuser = user.is_staff = True
+        user.set_password('benchmark')
+        user.save()
+        course.students.add(user)
+        samples = self.get_samples(course)
+        overrides = {'api:subject_detail': {'pk': course.subject_id}}
+        # errors are recorded as 500 responses
+        client = Client(raise_request_exception=False, HTTP_AUTHORIZATION='Basic ' + base64.b64encode(f'{user.username}:benchmark'.encode()).decode())
+        client.force_login(user)
+        results = {}
+        for name, pattern in sorted(self.get_patterns(), key=lambda item: item[0]):
+            arguments = list(pattern.pattern.regex.groupindex)
+            if name in SKIPPED_URLS or 'format' in arguments or not self.allows_get(pattern.callback):
+                continue
+            kwargs = {argument: overrides.get(name, {}).get(argument, samples.get(argument))
+                      for argument in arguments}
+            if None in kwargs.values():
+                results[name] = {'skipped': 'no sample object'}
+                continue
+            url = reverse(name, kwargs=kwargs)
+            cache.clear()
+            timings, queries = [], []
+            for _ in range(repeat + 1):
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    if getattr(response, 'streaming', False):
+                        b''.join(response.streaming_content)
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(len(context))
+            results[name] = {'url': url, 'status': response.status_code,
+                             'queries_cold': queries[0], 'queries_warm': queries[-1],
+                             'ms_cold': round(timings[0], 2), 'ms_warm': round(statistics.median(timings[1:]), 2)}
+        return results
+
+    def load_baseline(self, path):
+        if not os.path.exists(path):
+            self.stdout.write(self.style.WARNING(f'No baseline at {path}, save one with --output.'))
+            return None
+        with open(path) as f:
+            return json.load(f)['results']
+
+    def compare(self, results, baseline, path, time_tolerance):
+        regressions = []
+        for name in sorted(set(baseline) - set(results)):
+            self.stdout.write(self.style.WARNING(f'{name} is in the baseline but was not benchmarked.'))
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                # new URLs fail until the baseline is saved again, so none goes unmeasured
+                regressions.append(f'{name}: not in the baseline')
+                continue
+            if 'skipped' in result or 'skipped' in before:
+                continue
+            if result['status'] != before['status']:
+                regressions.append(f"{name}: status {before['status']} -> {result['status']}")
+            for key in ('queries_cold', 'queries_warm'):
+                if result[key] > before[key]:
+                    regressions.append(f'{name}: {key} {before[key]} -> {result[key]}')
+            if time_tolerance is not None and result['ms_warm'] > before['ms_warm'] * (1 + time_tolerance):
+                regressions.append(f"{name}: ms_warm {before['ms_warm']} -> {result['ms_warm']}")
+        if regressions:
+            raise CommandError('Regressions against the baseline:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {path}.'))
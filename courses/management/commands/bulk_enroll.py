@@ -0,0 +1,41 @@
+import sys
+from contextlib import ExitStack
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from courses.models import Course
+from courses.enrollment import bulk_enroll, read_usernames
+
+
+class Command(BaseCommand):
+    help = 'Enrolls or unenrolls many users on a course from usernames or a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='slug of the course')
+        parser.add_argument('usernames', nargs='*', help='usernames to enroll')
+        parser.add_argument('--csv', help='CSV file with the usernames in the first column, - for stdin')
+        parser.add_argument('--unenroll', action='store_true', help='remove the users from the course')
+        parser.add_argument('--chunk-size', type=int, default=settings.BULK_ENROLL_CHUNK_SIZE,
+                            help='rows written by each batch')
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(slug=options['course'])
+        except Course.DoesNotExist:
+            raise CommandError(f'Course "{options["course"]}" does not exist.')
+        changed = missing = 0
+        with ExitStack() as stack:
+            if options['csv'] == '-':
+                usernames = read_usernames(sys.stdin)
+            elif options['csv']:
+                # the file is streamed, one batch at a time
+                usernames = read_usernames(stack.enter_context(open(options['csv'], newline='', encoding='utf-8')))
+            else:
+                usernames = options['usernames']
+            for batch in bulk_enroll(course, usernames, options['chunk_size'], unenroll=options['unenroll']):
+                changed += batch['changed']
+                missing += len(batch['missing'])
+                self.stdout.write(f"batch {batch['batch']}: {batch['users']} users, {batch['changed']} changed, "
+                                  f"{len(batch['missing'])} missing, {batch['seconds']}s "
+                                  f"({batch['rows_per_second']} rows/s)")
+        verb = 'Unenrolled' if options['unenroll'] else 'Enrolled'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {changed} users on "{course}", {missing} usernames not found.'))
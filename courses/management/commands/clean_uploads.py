@@ -0,0 +1,35 @@
+import os
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from courses.models import Upload
+
+
+class Command(BaseCommand):
+    help = ('Removes the chunked uploads that received no chunk for settings.UPLOAD_EXPIRY seconds, '
+            'with their partial files, and partial files left without an upload. Run it periodically, e.g. from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--expiry', type=int, default=settings.UPLOAD_EXPIRY,
+                            help='seconds without a chunk after which an upload is abandoned')
+
+    def handle(self, *args, **options):
+        expiry = options['expiry']
+        stale = list(Upload.objects.filter(updated__lt=timezone.now() - timedelta(seconds=expiry)))
+        Upload.objects.filter(pk__in=[upload.pk for upload in stale]).delete()
+        for upload in stale:
+            if os.path.exists(upload.path):
+                os.remove(upload.path)
+        orphans = 0
+        if os.path.isdir(settings.UPLOAD_CHUNK_DIR):
+            ids = {str(id) for id in Upload.objects.values_list('id', flat=True)}
+            for name in os.listdir(settings.UPLOAD_CHUNK_DIR):
+                path = os.path.join(settings.UPLOAD_CHUNK_DIR, name)
+                # old files only, the upload of a new one may not be committed yet
+                if name.endswith('.part') and name[:-5] not in ids and os.path.getmtime(path) < time.time() - expiry:
+                    os.remove(path)
+                    orphans += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Removed {len(stale)} abandoned uploads and {orphans} partial files without an upload.'))
@@ -0,0 +1,28 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from courses.models import Course
+from courses.transfer import export_course
+
+
+class Command(BaseCommand):
+    help = ('Exports a course with its modules, contents and media files as JSON Lines, '
+            'streamed so courses of any size export in constant memory. See import_course')
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='slug of the course')
+        parser.add_argument('-o', '--output', help='file to write to, stdout by default')
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.select_related('subject').get(slug=options['course'])
+        except Course.DoesNotExist:
+            raise CommandError(f'Course "{options["course"]}" does not exist.')
+        missing = []
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.writelines(export_course(course, missing))
+            self.stdout.write(self.style.SUCCESS(f'Exported "{course.title}" to {options["output"]}.'))
+        else:
+            sys.stdout.writelines(export_course(course, missing))
+        for name in missing:
+            self.stderr.write(f'Media file {name} is missing, it was left out.')
@@ -0,0 +1,135 @@
+import io
+import random
+import time
+import uuid
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.models import Subject, Course, Module, Content, Text, Video, Image, File
+from courses.bulk import bulk_create_with_pks
+from courses.counters import recount_subjects, recount_courses
+from courses.caching import CATALOG_VERSION_KEY, course_version_key, module_version_key, bump_version, reset_versions
+from courses.video import get_embed
+
+WORDS = ('python django web data design music history math physics chemistry biology art '
+         'photography writing finance marketing cooking language guitar drawing statistics '
+         'machine learning network security cloud mobile game theory practice introduction advanced').split()
+
+# share of each kind of content item in the generated modules
+CONTENT_KINDS = {'text': 6, 'video': 2, 'image': 1, 'file': 1}
+
+
+class Command(BaseCommand):
+    help = ('Generates a synthetic dataset of subjects, courses, modules, contents and enrolled students '
+            'with bulk inserts, e.g. for benchmark_urls. Every run adds new rows next to the existing ones')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subjects', type=int, default=10)
+        parser.add_argument('--courses', type=int, default=20, help='courses per subject')
+        parser.add_argument('--modules', type=int, default=8, help='modules per course')
+        parser.add_argument('--contents', type=int, default=10, help='contents per module')
+        parser.add_argument('--instructors', type=int, default=20)
+        parser.add_argument('--students', type=int, default=1000)
+        parser.add_argument('--enrollments', type=int, default=5, help='courses per student')
+        parser.add_argument('--password', default='password', help='password of all the generated users')
+        parser.add_argument('--seed', type=int, help='seed of the random generator, for repeatable datasets')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        # suffix of the unique usernames and slugs of this run
+        self.tag = uuid.UUID(int=self.random.getrandbits(128)).hex[:8]
+        start = time.perf_counter()
+        with transaction.atomic():
+            password = make_password(options['password'])
+            instructors = self.create([
+                User(username=f'instructor-{self.tag}-{i}', password=password,
+                     first_name=self.words(1).title(), last_name=self.words(1).title())
+                for i in range(options['instructors'])])
+            students = self.create([User(username=f'student-{self.tag}-{i}', password=password)
+                                    for i in range(options['students'])])
+            subjects = self.create([Subject(title=self.words(2).title(), slug=f'subject-{self.tag}-{i}')
+                                    for i in range(options['subjects'])])
+            courses = self.create([
+                Course(owner=self.random.choice(instructors), subject=subject, title=self.words(4).title(),
+                       slug=f'course-{self.tag}-{subject.id}-{i}', overview=self.sentences(3))
+                for subject in subjects for i in range(options['courses'])])
+            # orders are allocated per course by OrderedQuerySet.bulk_create()
+            modules = self.create([Module(course=course, title=self.words(3).title(), description=self.sentences(2))
+                                   for course in courses for i in range(options['modules'])])
+            contents = self.create_contents(modules, options['contents'])
+            enrollments = self.enroll(students, courses, options['enrollments'])
+            # bulk inserts send no signals, update what the signal handlers keep current
+            recount_subjects([subject.id for subject in subjects])
+            recount_courses([course.id for course in courses])
+        bump_version(CATALOG_VERSION_KEY)
+        # the ids of deleted rows can be reused by the new ones, never serve what was cached for them
+        reset_versions([course_version_key(course.id) for course in courses]
+                       + [module_version_key(module.id) for module in modules])
+        call_command('rebuild_search_index', verbosity=0)
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {len(subjects)} subjects, {len(courses)} courses, {len(modules)} modules, '
+            f'{contents} contents, {len(instructors)} instructors and {len(students)} students '
+            f'with {enrollments} enrollments in {time.perf_counter() - start:.1f}s.'))
+
+    def create(self, objs):
+        return bulk_create_with_pks(objs, batch_size=self.batch_size)
+
+    def words(self, count):
+        return ' '.join(self.random.choices(WORDS, k=count))
+
+    def sentences(self, count):
+        return ' '.join(f'{self.words(self.random.randint(6, 14)).capitalize()}.' for _ in range(count))
+
+    def create_contents(self, modules, per_module):
+        image_name, file_name = self.sample_files()
+        kinds = self.random.choices(list(CONTENT_KINDS), weights=list(CONTENT_KINDS.values()),
+                                    k=len(modules) * per_module)
+        items = {kind: [] for kind in CONTENT_KINDS}
+        placements = []
+        for n, kind in enumerate(kinds):
+            module = modules[n // per_module]
+            owner_id, title = module.course.owner_id, self.words(3).title()
+            if kind == 'text':
+                item = Text(owner_id=owner_id, title=title, content=self.sentences(5))
+            elif kind == 'video':
+                item = Video(owner_id=owner_id, title=title,
+                             url=f'https://www.youtube.com/watch?v={uuid.UUID(int=self.random.getrandbits(128)).hex[:11]}')
+                # bulk inserts skip the signal resolving it, YouTube embeds are resolved without remote calls
+                item.set_embed(get_embed(item.url))
+            elif kind == 'image':
+                item = Image(owner_id=owner_id, title=title, file=image_name)
+            else:
+                item = File(owner_id=owner_id, title=title, file=file_name)
+            items[kind].append(item)
+            placements.append((module, item))
+        # items of each model in one batch, then the contents pointing at them
+        for objs in items.values():
+            self.create(objs)
+        self.create(Content(module=module, item=item) for module, item in placements)
+        return len(placements)
+
+    # one image and one file, stored once and shared by all the generated items
+    # like identical uploads are by the content-addressed storage
+    def sample_files(self):
+        from PIL import Image as PILImage
+
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (640, 360), (70, 130, 180)).save(buffer, 'PNG')
+        image_field, file_field = Image._meta.get_field('file'), File._meta.get_field('file')
+        image_name = image_field.storage.save(image_field.generate_filename(None, 'sample.png'),
+                                              ContentFile(buffer.getvalue()))
+        file_name = file_field.storage.save(file_field.generate_filename(None, 'sample.txt'),
+                                            ContentFile(self.sentences(20).encode()))
+        return image_name, file_name
+
+    def enroll(self, students, courses, per_student):
+        through = Course.students.through
+        rows = [through(user_id=student.id, course_id=course.id) for student in students
+                for course in self.random.sample(courses, min(per_student, len(courses)))]
+        through.objects.bulk_create(rows, batch_size=self.batch_size)
+        return len(rows)
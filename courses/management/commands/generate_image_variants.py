@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from courses.images import get_executor, generate_variants
+from courses.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Generates the resized variants of the images that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='regenerate the variants of every image')
+
+    def handle(self, *args, **options):
+        images = [image for image in Image.objects.exclude(file='')
+                  if options['all'] or not image.has_variants()]
+        futures = [(image, get_executor().submit(generate_variants, image.file.storage, image.file.name,
+                                                 settings.IMAGE_VARIANT_WIDTHS, settings.IMAGE_VARIANT_QUALITY))
+                   for image in images]
+        for image, future in futures:
+            image.set_variants(future.result())
+            image.save(update_fields=['variants', 'updated'])
+        self.stdout.write(self.style.SUCCESS(f'Generated the variants of {len(futures)} images.'))
@@ -0,0 +1,36 @@
+import sys
+import time
+from contextlib import ExitStack
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from courses.transfer import import_course
+
+
+class Command(BaseCommand):
+    help = 'Imports a course exported by export_course, with bulk inserts in a single transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='JSON Lines file of the course, - for stdin')
+        parser.add_argument('--owner', required=True, help='username of the instructor owning the imported course')
+        parser.add_argument('--slug', help='slug of the imported course, the exported one by default')
+        parser.add_argument('--batch-size', type=int, default=1000, help='rows written by each insert')
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(username=options['owner'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["owner"]}" does not exist.')
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            # the file is read a line at a time
+            if options['file'] == '-':
+                lines = sys.stdin
+            else:
+                lines = stack.enter_context(open(options['file'], encoding='utf-8'))
+            try:
+                course = import_course(lines, owner, slug=options['slug'], batch_size=options['batch_size'])
+            except ValueError as e:
+                raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported "{course.title}" as {course.slug} with {course.modules.count()} modules '
+            f'in {time.perf_counter() - start:.1f}s.'))
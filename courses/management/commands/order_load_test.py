@@ -0,0 +1,60 @@
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from courses.models import Subject, Course, Module
+
+
+class Command(BaseCommand):
+    help = 'Creates modules from many parallel writers and checks that no two get the same order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help='number of parallel writers')
+        parser.add_argument('--inserts', type=int, default=50, help='modules created by each writer')
+        parser.add_argument('--bulk', type=int, default=0,
+                            help='create modules with bulk_create() in batches of this size')
+
+    def handle(self, *args, **options):
+        writers, inserts, bulk = options['writers'], options['inserts'], options['bulk']
+        # scratch course, removed with all of its modules when the test is over
+        name = f'order-load-test-{uuid.uuid4().hex[:12]}'
+        owner = User.objects.create_user(name)
+        subject = Subject.objects.create(title=name, slug=name)
+        course = Course.objects.create(owner=owner, subject=subject, title=name, slug=name)
+        try:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=writers) as executor:
+                for future in [executor.submit(self.write, course, writer, inserts, bulk)
+                               for writer in range(writers)]:
+                    future.result()
+            elapsed = time.perf_counter() - start
+
+            modules = Module.objects.filter(course=course)
+            total = modules.count()
+            duplicates = modules.values('order').annotate(count=Count('id')).filter(count__gt=1)
+            self.stdout.write(f'{total} modules created by {writers} writers in {elapsed:.2f}s '
+                              f'({total / elapsed:.0f} inserts/s)')
+            if total != writers * inserts:
+                raise CommandError(f'Expected {writers * inserts} modules, found {total}.')
+            if duplicates:
+                raise CommandError(f'{len(duplicates)} orders were given to more than one module.')
+            self.stdout.write(self.style.SUCCESS('No duplicate orders.'))
+        finally:
+            subject.delete()
+            owner.delete()
+
+    def write(self, course, writer, inserts, bulk):
+        try:
+            if bulk:
+                for i in range(0, inserts, bulk):
+                    Module.objects.bulk_create([Module(course=course, title=f'{writer}.{n}')
+                                                for n in range(i, min(i + bulk, inserts))])
+            else:
+                for n in range(inserts):
+                    Module.objects.create(course=course, title=f'{writer}.{n}')
+        finally:
+            # every thread opens its own database connection
+            connection.close()
@@ -0,0 +1,30 @@
+from collections import defaultdict
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.models import Course, Module, Content, Text
+from courses.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the search index of courses, modules and text contents'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        with transaction.atomic():
+            backend.clear()
+            backend.add(('course', course.id, course.id, course.title, course.overview)
+                        for course in Course.objects.only('id', 'title', 'overview').iterator())
+            backend.add(('module', module.id, module.course_id, module.title, module.description)
+                        for module in Module.objects.only('id', 'course_id', 'title', 'description').iterator())
+            # courses of every text item that is part of a module
+            text_courses = defaultdict(set)
+            for text_id, course_id in Content.objects.filter(content_type=ContentType.objects.get_for_model(Text)) \
+                    .values_list('object_id', 'module__course_id'):
+                text_courses[text_id].add(course_id)
+            backend.add(('text', text.id, course_id, text.title, text.content)
+                        for text in Text.objects.filter(id__in=text_courses).iterator()
+                        for course_id in sorted(text_courses[text.id]))
+            texts = len(text_courses)
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {Course.objects.count()} courses, {Module.objects.count()} modules and {texts} texts.'))
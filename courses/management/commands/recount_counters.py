@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from courses.caching import CATALOG_VERSION_KEY, bump_version
+from courses.counters import recount_subjects, recount_courses
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the denormalized course, module and student counters'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            subjects = recount_subjects()
+            courses = recount_courses()
+        # counters are part of the cached catalog rows
+        bump_version(CATALOG_VERSION_KEY)
+        self.stdout.write(self.style.SUCCESS(f'Recounted {subjects} subjects and {courses} courses.'))
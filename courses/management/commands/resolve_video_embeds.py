@@ -0,0 +1,38 @@
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from courses.models import Content, Video
+from courses.caching import course_version_key, module_version_key, bump_version
+from courses.video import get_embed
+
+
+class Command(BaseCommand):
+    help = ('Resolves the embed metadata of the videos that have none, e.g. videos created with bulk '
+            'inserts or whose provider could not be reached when they were saved')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='resolve the embed of every video again')
+
+    def handle(self, *args, **options):
+        videos = [video for video in Video.objects.all()
+                  if options['all'] or not video.has_embed() or not video.get_embed().get('embed_url')]
+        # one resolution per URL, many videos can share one
+        embeds = {}
+        for video in videos:
+            if video.url not in embeds:
+                embeds[video.url] = get_embed(video.url)
+            video.set_embed(embeds[video.url])
+            # a new updated time also drops the cached render of the video
+            video.updated = timezone.now()
+        Video.objects.bulk_update(videos, ['embed', 'updated'], batch_size=500)
+        # bulk updates send no signals, refresh the cached pages of the courses showing them
+        modules = set(Content.objects.filter(content_type=ContentType.objects.get_for_model(Video),
+                                             object_id__in=[video.id for video in videos])
+                      .values_list('module_id', 'module__course_id'))
+        for module_id, _ in modules:
+            bump_version(module_version_key(module_id))
+        for course_id in {course_id for _, course_id in modules}:
+            bump_version(course_version_key(course_id))
+        resolved = sum(1 for embed in embeds.values() if embed.get('embed_url'))
+        self.stdout.write(self.style.SUCCESS(
+            f'Resolved {resolved} of {len(embeds)} video URLs for {len(videos)} videos.'))
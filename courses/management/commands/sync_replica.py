@@ -0,0 +1,27 @@
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Copies the SQLite primary database into the SQLite replicas, '
+            'standing in for replication when trying the replicas locally')
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError('No replicas configured, set EDUCA_DB_REPLICA.')
+        source = connections[DEFAULT_DB_ALIAS]
+        if source.vendor != 'sqlite':
+            raise CommandError('Only SQLite databases can be copied, use the replication of your database.')
+        source.ensure_connection()
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias]
+            replica.close()
+            # the backup API copies a consistent snapshot, even while the primary is being written
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                source.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'Copied {DEFAULT_DB_ALIAS} into {alias}.'))
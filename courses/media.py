@@ -0,0 +1,57 @@
+import re
+from django.contrib.contenttypes.models import ContentType
+from .models import Course, Content, File, Image
+from .caching import is_enrolled
+
+# resized copies of images are named after the original, e.g. images/ab/abcd.w320.jpg
+VARIANT_RE = re.compile(r'^(?P<root>.+)\.w\d+\.jpg$')
+
+
+# items whose file (or one of its variants) is stored under the given media name
+def get_media_items(name):
+    items = list(File.objects.filter(file=name)) + list(Image.objects.filter(file=name))
+    match = VARIANT_RE.match(name)
+    if not items and match:
+        items = [image for image in Image.objects.filter(file__startswith=match.group('root') + '.')
+                 if name in image.get_variants().get('widths', {}).values()]
+    return items
+
+
+# a user can download a media file if they own one of the items stored in it, or own
+# or are enrolled on one of the courses those items are part of.
+# Content-addressed files can be shared by several items and courses
+def can_access_media(user, name):
+    if not user.is_authenticated:
+        return False
+    items = get_media_items(name)
+    if any(item.owner_id == user.id for item in items):
+        return True
+    course_ids = set()
+    for item in items:
+        course_ids.update(Content.objects.filter(content_type=ContentType.objects.get_for_model(item),
+                                                 object_id=item.id).values_list('module__course_id', flat=True))
+    if any(is_enrolled(user, course_id) for course_id in course_ids):
+        return True
+    return Course.objects.filter(id__in=course_ids, owner=user).exists()
+
+
+# parses a single "bytes=<start>-<end>" range, returns (start, end) with an inclusive end,
+# None to serve the whole file (no range, several ranges or an invalid one, such as an end
+# before the start) or raises ValueError when the range cannot be satisfied
+def parse_range(header, size):
+    match = re.match(r'^bytes=(\d*)-(\d*)$', header.strip())
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # suffix range, the last <end> bytes. An empty file has none
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise ValueError
+    return start, min(int(end), size - 1) if end else size - 1
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.9 on 2026-10-17 20:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0005_ordersequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['-created', '-id'], name='courses_cou_created_6b44b3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['subject', '-created', '-id'], name='courses_cou_subject_6a3067_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.0.9 on 2026-10-17 20:20
+
+from django.db import migrations
+
+
+# the FTS5 table used by courses.search.SQLiteFTSBackend, other databases need another backend
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS courses_search_index USING fts5('
+            'doc_type UNINDEXED, object_id UNINDEXED, course_id UNINDEXED, title, body, '
+            "tokenize = 'porter unicode61')")
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS courses_search_index')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_course_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.0.9 on 2026-10-17 20:09
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field) \
+        .annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+# fill the new counters from the existing rows
+def recount(apps, schema_editor):
+    Subject = apps.get_model('courses', 'Subject')
+    Course = apps.get_model('courses', 'Course')
+    Module = apps.get_model('courses', 'Module')
+    db = schema_editor.connection.alias
+    Subject.objects.using(db).update(total_courses=count_subquery(Course.objects.all(), 'subject'))
+    Course.objects.using(db).update(total_modules=count_subquery(Module.objects.all(), 'course'),
+                          total_students=count_subquery(Course.students.through.objects.all(), 'course'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='total_modules',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='total_students',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='subject',
+            name='total_courses',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(recount, migrations.RunPython.noop),
+    ]
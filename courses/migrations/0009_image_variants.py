@@ -0,0 +1,18 @@
+# Generated by Django 3.0.9 on 2026-10-17 20:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='variants',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
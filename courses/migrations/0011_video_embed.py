@@ -0,0 +1,18 @@
+# Generated by Django 3.0.9 on 2026-10-17 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_uploads_content_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='embed',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
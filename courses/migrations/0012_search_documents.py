@@ -0,0 +1,34 @@
+# Generated by Django 3.0.9 on 2026-10-17 21:10
+
+from django.db import migrations
+
+
+# rowids of the documents of courses_search_index by type and object id. Its doc_type and
+# object_id columns cannot be indexed, filtering on them scans the whole index
+def create_search_documents(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE TABLE IF NOT EXISTS courses_search_document ('
+            'id integer NOT NULL PRIMARY KEY, doc_type varchar(10) NOT NULL, object_id integer NOT NULL)')
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS courses_search_document_object '
+            'ON courses_search_document (doc_type, object_id)')
+        schema_editor.execute(
+            'INSERT INTO courses_search_document (id, doc_type, object_id) '
+            'SELECT rowid, doc_type, object_id FROM courses_search_index')
+
+
+def drop_search_documents(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS courses_search_document')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_video_embed'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_documents, drop_search_documents),
+    ]
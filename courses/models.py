@@ -1,14 +1,26 @@
-from django.db import models
+import json
+import os
+import uuid
+from django.db import models, transaction
+from django.db.models import Case, When, Value
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.template.loader import render_to_string
 from .fields import OrderField
+from .storage import ContentAddressedStorage
+
+# File and Image share identical uploads through this storage
+content_storage = ContentAddressedStorage()
 
 
 class Subject(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
+    # denormalized number of courses, kept current by courses.counters
+    total_courses = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['title']
@@ -32,13 +44,68 @@ class Course(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     # associates students with courses they are enrolled
     students = models.ManyToManyField(User, related_name='courses_joined', blank=True)
+    # denormalized number of modules and students, kept current by courses.counters
+    total_modules = models.PositiveIntegerField(default=0, editable=False)
+    total_students = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-created']
+        # keyset pagination of the catalog walks these indexes
+        indexes = [
+            models.Index(fields=['-created', '-id']),
+            models.Index(fields=['subject', '-created', '-id']),
+        ]
 
     def __str__(self):
         return self.title
 
+# holds the next free value of an OrderField for one scope, e.g. the modules of a course
+class OrderSequence(models.Model):
+    scope = models.CharField(max_length=255, unique=True)
+    value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.scope}: {self.value}'
+
+
+class OrderedQuerySet(models.QuerySet):
+    # number of rows written by a single UPDATE statement
+    reorder_batch_size = 250
+
+    # bulk_create() skips pre_save(), so reserve a block of orders per scope beforehand
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for field in self.model._meta.concrete_fields:
+            if isinstance(field, OrderField):
+                field.allocate_many(objs)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    # this will apply a {id: order} mapping to the objects of this queryset
+    # in one transaction and return the number of rows whose order changed.
+    # Ids outside this queryset (unknown or belonging to another user) reject the whole payload
+    def reorder(self, orders):
+        try:
+            orders = {int(id): int(order) for id, order in orders.items()}
+        except (AttributeError, TypeError, ValueError):
+            raise ValueError('Order payload must map object ids to integer orders.')
+        if any(order < 0 for order in orders.values()):
+            raise ValueError('Orders must not be negative.')
+        with transaction.atomic():
+            # check ownership of all the ids at once and lock the rows
+            current = dict(self.select_for_update().filter(pk__in=orders).values_list('pk', 'order'))
+            unknown = sorted(set(orders) - set(current))
+            if unknown:
+                raise ValueError(f'Unknown ids: {", ".join(map(str, unknown))}.')
+            changed = [(id, order) for id, order in orders.items() if current[id] != order]
+            for i in range(0, len(changed), self.reorder_batch_size):
+                batch = changed[i:i + self.reorder_batch_size]
+                # one UPDATE ... SET order = CASE id WHEN ... END for the whole batch
+                self.model._default_manager.filter(pk__in=[id for id, _ in batch]).update(
+                    order=Case(*[When(pk=id, then=Value(order)) for id, order in batch],
+                               output_field=self.model._meta.get_field('order')))
+        return len(changed)
+
+
 # each course is divided into several modules
 class Module(models.Model):
     course = models.ForeignKey(Course, related_name='modules', on_delete=models.CASCADE)
@@ -47,6 +114,8 @@ class Module(models.Model):
     # ordering is calculated with respect to the course
     order = OrderField(blank=True, for_fields=['course'])
 
+    objects = OrderedQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.order}. {self.title}'
 
@@ -54,6 +123,17 @@ class Module(models.Model):
         ordering = ['order']
 
 
+class ContentQuerySet(OrderedQuerySet):
+    # loads the generic item of every content in one query per content type,
+    # instead of one query per content row when looping over content.item
+    def with_items(self, owner=False):
+        lookups = ['item']
+        if owner:
+            # also load the owner of each item in one query
+            lookups.append('item__owner')
+        return self.prefetch_related(*lookups)
+
+
 class Content(models.Model):
     module = models.ForeignKey(Module, related_name='contents', on_delete=models.CASCADE)
     # limit_choices argument will limit the ContentType objects
@@ -66,6 +146,8 @@ class Content(models.Model):
     # order is calculated with respect to the module field
     order = OrderField(blank=True, for_fields=['module'])
 
+    objects = ContentQuerySet.as_manager()
+
     class Meta:
         ordering = ['order']
 
@@ -83,9 +165,24 @@ class ItemBase(models.Model):
     def __str__(self):
         return self.title
 
+    def render_cache_key(self):
+        # the updated timestamp changes every time the item is saved,
+        # so an edited item never hits the output rendered before the edit.
+        # The version changes with the templates, see settings.ITEM_RENDER_CACHE_VERSION
+        return f'item_render:{settings.ITEM_RENDER_CACHE_VERSION}:{self._meta.label_lower}:' \
+               f'{self.pk}:{self.updated.timestamp()}'
+
     def render(self):
-        # rendering template and returning the rendered content as a string
-        return render_to_string(f'courses/content/{self._meta.model_name}.html', {'item': self})
+        # unsaved items have no stable key, render them directly
+        if self.pk is None or self.updated is None:
+            return render_to_string(f'courses/content/{self._meta.model_name}.html', {'item': self})
+        key = self.render_cache_key()
+        html = cache.get(key)
+        if html is None:
+            # rendering template and returning the rendered content as a string
+            html = render_to_string(f'courses/content/{self._meta.model_name}.html', {'item': self})
+            cache.set(key, html, settings.ITEM_RENDER_CACHE_TIMEOUT)
+        return html
 
 # stores content
 class Text(ItemBase):
@@ -93,12 +190,80 @@ class Text(ItemBase):
 
 # stores files, e.g. PDF
 class File(ItemBase):
-    file = models.FileField(upload_to='files')
+    file = models.FileField(upload_to='files', storage=content_storage)
 
 # stores images
 class Image(ItemBase):
-       file = models.FileField(upload_to='images')
+    file = models.FileField(upload_to='images', storage=content_storage)
+    # resized copies generated by courses.images, stored as JSON:
+    # {"source": file name, "width": ..., "height": ..., "widths": {"320": variant file name}}
+    variants = models.TextField(blank=True, editable=False)
+
+    def get_variants(self):
+        return json.loads(self.variants) if self.variants else {}
+
+    def set_variants(self, variants):
+        self.variants = json.dumps(variants)
+
+    # variants are outdated as soon as another file is uploaded
+    def has_variants(self):
+        return self.get_variants().get('source') == self.file.name
+
+    # value of the srcset attribute of the <img> tag, from the smallest variant to the original
+    def srcset(self):
+        variants = self.get_variants()
+        if not self.has_variants() or not variants['widths']:
+            return ''
+        storage = self.file.storage
+        sources = [f'{storage.url(name)} {width}w' for width, name in
+                   sorted(variants['widths'].items(), key=lambda variant: int(variant[0]))]
+        sources.append(f'{self.file.url} {variants["width"]}w')
+        return ', '.join(sources)
 
 # stores videos. through url
 class Video(ItemBase):
-    url = models.URLField()
\ No newline at end of file
+    url = models.URLField()
+    # player of the video resolved by courses.video when it is saved, stored as JSON:
+    # {"source": url, "provider": ..., "embed_url": ..., "thumbnail_url": ..., "width": ..., "height": ...}
+    embed = models.TextField(blank=True, editable=False)
+
+    def get_embed(self):
+        return json.loads(self.embed) if self.embed else {}
+
+    def set_embed(self, embed):
+        self.embed = json.dumps(embed)
+
+    # the embed is outdated as soon as the URL changes
+    def has_embed(self):
+        return self.get_embed().get('source') == self.url
+
+    # height of the 480 pixels wide player, keeping the aspect ratio of the video if it is known
+    def player_height(self):
+        embed = self.get_embed()
+        if embed.get('width') and embed.get('height'):
+            return round(480 * embed['height'] / embed['width'])
+        return 360
+
+
+# a file being uploaded in chunks, its bytes are appended to UPLOAD_CHUNK_DIR/<id>.part
+# until all of them are received and the file is moved to the content storage
+class Upload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(User, related_name='uploads', on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    # number of bytes received so far, the offset of the next chunk
+    received = models.BigIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def path(self):
+        return os.path.join(settings.UPLOAD_CHUNK_DIR, f'{self.id}.part')
+
+    @property
+    def complete(self):
+        return self.received == self.size
\ No newline at end of file
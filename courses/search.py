@@ -0,0 +1,189 @@
+import re
+from functools import lru_cache
+from itertools import islice
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.utils.module_loading import import_string
+from .models import Content, Text
+
+
+# interface of the search index, documents are identified by their type and object id
+# and belong to a course, e.g. ('module', 7, 3, 'Introduction', 'What we will learn').
+# A text item is part of every course with a module pointing to it, so it has one document per course
+class SearchBackend:
+    def index(self, doc_type, object_id, course_id, title, body):
+        raise NotImplementedError
+
+    # indexes (doc_type, object_id, course_id, title, body) documents that are not in the index yet,
+    # e.g. right after clear()
+    def add(self, documents):
+        for document in documents:
+            self.index(*document)
+
+    # removes the documents of the object, from every course
+    def remove(self, doc_type, object_id):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    # returns a SearchResults sequence, best matches first.
+    # Text documents are only returned for the courses in text_course_ids
+    def search(self, query, text_course_ids=()):
+        raise NotImplementedError
+
+    # number of matches of a query returned by search(), used by SearchResults
+    def count(self, query, text_course_ids):
+        raise NotImplementedError
+
+    # limit matches starting at offset as dicts with the type, id, course, title, snippet and score,
+    # a negative limit returns all of them. Used by SearchResults
+    def fetch(self, query, text_course_ids, offset, limit):
+        raise NotImplementedError
+
+
+# lazy result sequence, so paginators only fetch the rows of the requested page
+class SearchResults:
+    def __init__(self, backend, query, text_course_ids):
+        self.backend = backend
+        self.query = query
+        self.text_course_ids = text_course_ids
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = self.backend.count(self.query, self.text_course_ids)
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        limit = -1 if stop is None else max(stop - start, 0)
+        return self.backend.fetch(self.query, self.text_course_ids, start, limit)
+
+
+# inverted index stored in an SQLite FTS5 virtual table created by the courses migrations.
+# Its doc_type and object_id columns cannot be indexed, the rowids of the documents of an
+# object are looked up in the documents table so they are replaced without scanning the index
+class SQLiteFTSBackend(SearchBackend):
+    table = 'courses_search_index'
+    documents_table = 'courses_search_document'
+    # bm25() weights of the doc_type, object_id, course_id, title and body columns
+    weights = (0.0, 0.0, 0.0, 10.0, 1.0)
+    # rows written by each executemany() of add()
+    batch_size = 1000
+
+    def index(self, doc_type, object_id, course_id, title, body):
+        # FTS5 tables have no unique constraint, replace the previous document by hand
+        self.remove(doc_type, object_id)
+        self.add([(doc_type, object_id, course_id, title, body)])
+
+    def add(self, documents):
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, self.batch_size))
+            if not batch:
+                break
+            # the ids of the new rows of the documents table are the rowids of the documents.
+            # Nothing else is inserted once the transaction wrote its first row, so they are
+            # consecutive and end at the highest one
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(f'INSERT INTO {self.documents_table} (doc_type, object_id) VALUES (%s, %s)',
+                                   [document[:2] for document in batch])
+                cursor.execute(f'SELECT max(id) FROM {self.documents_table}')
+                first = cursor.fetchone()[0] - len(batch) + 1
+                cursor.executemany(f'INSERT INTO {self.table} (rowid, doc_type, object_id, course_id, title, body) '
+                                   f'VALUES (%s, %s, %s, %s, %s, %s)',
+                                   [(rowid, *document) for rowid, document in enumerate(batch, first)])
+
+    def remove(self, doc_type, object_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {self.documents_table} WHERE doc_type = %s AND object_id = %s',
+                           [doc_type, object_id])
+            rowids = cursor.fetchall()
+            if rowids:
+                cursor.executemany(f'DELETE FROM {self.table} WHERE rowid = %s', rowids)
+                cursor.executemany(f'DELETE FROM {self.documents_table} WHERE id = %s', rowids)
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(f'DELETE FROM {self.documents_table}')
+
+    def search(self, query, text_course_ids=()):
+        return SearchResults(self, self.parse_query(query), list(text_course_ids))
+
+    # turns user input into an FTS5 query matching documents that contain every word,
+    # quoting words so that FTS5 operators in the input are taken literally
+    def parse_query(self, query):
+        return ' '.join(f'"{word}"' for word in re.findall(r'\w+', query))
+
+    def get_where(self, query, text_course_ids):
+        where = f"{self.table} MATCH %s AND (doc_type != 'text'"
+        params = [query]
+        if text_course_ids:
+            where += f" OR course_id IN ({', '.join(['%s'] * len(text_course_ids))})"
+            params += text_course_ids
+        return where + ')', params
+
+    def count(self, query, text_course_ids):
+        if not query:
+            return 0
+        where, params = self.get_where(query, text_course_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {self.table} WHERE {where}', params)
+            return cursor.fetchone()[0]
+
+    def fetch(self, query, text_course_ids, offset, limit):
+        if not query:
+            return []
+        where, params = self.get_where(query, text_course_ids)
+        weights = ', '.join(map(str, self.weights))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT doc_type, object_id, course_id, title, "
+                f"snippet({self.table}, 4, '<b>', '</b>', '...', 16), bm25({self.table}, {weights}) AS rank "
+                f"FROM {self.table} WHERE {where} ORDER BY rank LIMIT %s OFFSET %s",
+                params + [limit, offset])
+            return [{'type': doc_type, 'id': object_id, 'course': course_id, 'title': title,
+                     'snippet': snippet, 'score': -rank}
+                    for doc_type, object_id, course_id, title, snippet, rank in cursor.fetchall()]
+
+
+# the backend configured by settings.SEARCH_BACKEND
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+# e.g. override_settings(SEARCH_BACKEND=...) in tests
+def search_backend_changed(setting, **kwargs):
+    if setting == 'SEARCH_BACKEND':
+        get_backend.cache_clear()
+
+
+setting_changed.connect(search_backend_changed, dispatch_uid='search_backend_changed')
+
+
+def index_course(course):
+    get_backend().index('course', course.id, course.id, course.title, course.overview)
+
+
+def index_module(module):
+    get_backend().index('module', module.id, module.course_id, module.title, module.description)
+
+
+# text items only belong to a course once a content of a module points to them,
+# the documents of the courses it is no longer part of are dropped
+def index_text(text):
+    course_ids = Content.objects.filter(content_type=ContentType.objects.get_for_model(Text), object_id=text.id) \
+        .values_list('module__course_id', flat=True).order_by('module__course_id').distinct()
+    backend = get_backend()
+    backend.remove('text', text.id)
+    backend.add(('text', text.id, course_id, text.title, text.content) for course_id in course_ids)
@@ -0,0 +1,200 @@
+from contextvars import ContextVar
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from .models import Subject, Course, Module, Content, Text, File, Image, Video
+from .images import schedule_variants
+from .video import get_embed
+from .counters import increment, recount_subjects, recount_courses
+from .search import get_backend, index_course, index_module, index_text
+from .caching import CATALOG_VERSION_KEY, course_version_key, module_version_key, forget_enrollments, bump_version
+
+
+# any change to subjects, courses or modules changes the catalog listing
+def catalog_changed(sender, **kwargs):
+    bump_version(CATALOG_VERSION_KEY)
+
+
+def course_changed(sender, instance, **kwargs):
+    bump_version(course_version_key(instance.pk))
+
+
+# also bumps the contents version of new modules, their id may have belonged to a deleted one
+def module_changed(sender, instance, **kwargs):
+    bump_version(course_version_key(instance.course_id))
+    bump_version(module_version_key(instance.pk))
+
+
+def content_changed(sender, instance, **kwargs):
+    bump_version(module_version_key(instance.module_id))
+    course_ids = Module.objects.filter(id=instance.module_id).values_list('course_id', flat=True)
+    for course_id in course_ids:
+        bump_version(course_version_key(course_id))
+
+
+# an item can be displayed by any content pointing to it
+def item_changed(sender, instance, **kwargs):
+    modules = set(Content.objects.filter(content_type=ContentType.objects.get_for_model(sender),
+                                         object_id=instance.pk)
+                  .values_list('module_id', 'module__course_id'))
+    for module_id, _ in modules:
+        bump_version(module_version_key(module_id))
+    for course_id in {course_id for _, course_id in modules}:
+        bump_version(course_version_key(course_id))
+
+
+for model in (Subject, Course, Module):
+    post_save.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_changed_{model.__name__}_save')
+    post_delete.connect(catalog_changed, sender=model, dispatch_uid=f'catalog_changed_{model.__name__}_delete')
+
+for model, handler in [(Course, course_changed), (Module, module_changed), (Content, content_changed),
+                       (Text, item_changed), (File, item_changed),
+                       (Image, item_changed), (Video, item_changed)]:
+    post_save.connect(handler, sender=model, dispatch_uid=f'course_changed_{model.__name__}_save')
+    post_delete.connect(handler, sender=model, dispatch_uid=f'course_changed_{model.__name__}_delete')
+
+
+# drops the cached enrolled courses of the users whose enrollments changed
+def enrollment_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # user.courses_joined was changed
+        user_ids = [instance.pk]
+    elif action == 'pre_clear':
+        # course.students.clear() sends no pk_set, remember who is enrolled before clearing
+        instance._cleared_student_ids = list(instance.students.values_list('id', flat=True))
+        return
+    elif action == 'post_clear':
+        user_ids = getattr(instance, '_cleared_student_ids', [])
+    else:
+        user_ids = pk_set or []
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        forget_enrollments(user_ids)
+
+
+m2m_changed.connect(enrollment_changed, sender=Course.students.through, dispatch_uid='enrollment_changed')
+
+
+# keeps the search index current, one document per course, module and text item
+def course_saved(sender, instance, **kwargs):
+    index_course(instance)
+
+
+def module_saved(sender, instance, **kwargs):
+    index_module(instance)
+
+
+def text_saved(sender, instance, **kwargs):
+    index_text(instance)
+
+
+# a text item is indexed once a content adds it to a module
+def content_saved(sender, instance, created, **kwargs):
+    if created and instance.content_type.model == 'text':
+        index_text(instance.item)
+
+
+# the text may still be part of other courses
+def content_deleted(sender, instance, **kwargs):
+    if instance.content_type.model == 'text':
+        text = Text.objects.filter(id=instance.object_id).first()
+        if text:
+            index_text(text)
+        else:
+            get_backend().remove('text', instance.object_id)
+
+
+def document_deleted(sender, instance, **kwargs):
+    get_backend().remove(sender._meta.model_name, instance.pk)
+
+
+post_save.connect(course_saved, sender=Course, dispatch_uid='search_course_saved')
+post_save.connect(module_saved, sender=Module, dispatch_uid='search_module_saved')
+post_save.connect(text_saved, sender=Text, dispatch_uid='search_text_saved')
+post_save.connect(content_saved, sender=Content, dispatch_uid='search_content_saved')
+post_delete.connect(content_deleted, sender=Content, dispatch_uid='search_content_deleted')
+for model in (Course, Module, Text):
+    post_delete.connect(document_deleted, sender=model, dispatch_uid=f'search_{model.__name__}_deleted')
+
+
+# keeps Subject.total_courses, Course.total_modules and Course.total_students current
+def course_pre_save(sender, instance, **kwargs):
+    # remember the stored subject, to move the course between subject counters
+    if instance.pk and not instance._state.adding:
+        instance._stored_subject_id = Course.objects.filter(pk=instance.pk) \
+            .values_list('subject_id', flat=True).first()
+
+
+def course_counted(sender, instance, created, **kwargs):
+    stored_subject_id = getattr(instance, '_stored_subject_id', None)
+    if created:
+        increment(Subject, [instance.subject_id], 'total_courses')
+    elif stored_subject_id is not None and stored_subject_id != instance.subject_id:
+        increment(Subject, [stored_subject_id], 'total_courses', -1)
+        increment(Subject, [instance.subject_id], 'total_courses')
+
+
+# ids of the courses being deleted. Their modules are deleted first, one post_delete each,
+# and there is no counter left to recount for them
+_deleting_course_ids = ContextVar('deleting_course_ids', default=frozenset())
+
+
+def course_deleting(sender, instance, **kwargs):
+    _deleting_course_ids.set(_deleting_course_ids.get() | {instance.pk})
+
+
+# rows created by bulk_create() were never counted, so deletions recount instead of subtracting
+def course_uncounted(sender, instance, **kwargs):
+    _deleting_course_ids.set(_deleting_course_ids.get() - {instance.pk})
+    recount_subjects([instance.subject_id])
+
+
+def module_counted(sender, instance, created, **kwargs):
+    if created:
+        increment(Course, [instance.course_id], 'total_modules')
+
+
+def module_uncounted(sender, instance, **kwargs):
+    if instance.course_id not in _deleting_course_ids.get():
+        recount_courses([instance.course_id], students=False)
+
+
+# removals may name users that were not enrolled, so students are recounted instead
+def students_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        course_ids = [instance.pk]
+    elif action == 'pre_clear':
+        # user.courses_joined.clear() sends no pk_set, remember the courses before clearing
+        instance._cleared_course_ids = list(instance.courses_joined.values_list('id', flat=True))
+        return
+    elif action == 'post_clear':
+        course_ids = getattr(instance, '_cleared_course_ids', [])
+    else:
+        course_ids = pk_set or []
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        recount_courses(course_ids, modules=False)
+
+
+pre_save.connect(course_pre_save, sender=Course, dispatch_uid='counters_course_pre_save')
+post_save.connect(course_counted, sender=Course, dispatch_uid='counters_course_saved')
+pre_delete.connect(course_deleting, sender=Course, dispatch_uid='counters_course_deleting')
+post_delete.connect(course_uncounted, sender=Course, dispatch_uid='counters_course_deleted')
+post_save.connect(module_counted, sender=Module, dispatch_uid='counters_module_saved')
+post_delete.connect(module_uncounted, sender=Module, dispatch_uid='counters_module_deleted')
+m2m_changed.connect(students_changed, sender=Course.students.through, dispatch_uid='counters_students_changed')
+
+
+# resized variants are generated in the background for every newly uploaded image file
+def image_saved(sender, instance, **kwargs):
+    if instance.file and not instance.has_variants():
+        schedule_variants(instance)
+
+
+post_save.connect(image_saved, sender=Image, dispatch_uid='image_variants')
+
+
+# the embed of a video is resolved once, when it is saved with a new URL, so rendering it makes no remote calls
+def video_pre_save(sender, instance, raw=False, **kwargs):
+    if not raw and not instance.has_embed():
+        instance.set_embed(get_embed(instance.url))
+
+
+pre_save.connect(video_pre_save, sender=Video, dispatch_uid='video_embed')
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import posixpath
+import threading
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+# returns the hex SHA-256 of a file, reading it in chunks
+def file_sha256(content):
+    sha = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()
+
+
+# stores every file under the hash of its content, e.g. files/3a/3a7bd3e2...9f.pdf,
+# so identical uploads are written once and shared by all the rows that reference them.
+# Rows never delete their files, so a shared file stays as long as any row points to it
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def get_hashed_name(self, name, sha256):
+        directory, ext = posixpath.dirname(name), os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, sha256[:2], sha256 + ext)
+
+    def _save(self, name, content):
+        if getattr(content, 'keep_name', False):
+            return super()._save(name, content)
+        # assembled chunked uploads are hashed beforehand and pass the hash along
+        sha256 = getattr(content, 'sha256', None) or file_sha256(content)
+        name = self.get_hashed_name(name, sha256)
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+# a file derived from a stored one, e.g. a resized image variant. It is saved under the name it
+# is given, derived from the name of the original, which is how it is found from the original
+class DerivedContentFile(ContentFile):
+    keep_name = True
+
+
+# an assembled chunked upload, already hashed. FileSystemStorage moves files that have a
+# temporary_file_path() instead of copying them, so the bytes are never read again
+class HashedTemporaryFile(File):
+    def __init__(self, path, name, sha256):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.path
+
+
+# running SHA-256 of the chunked uploads received by this process, so a complete upload is not
+# read again to hash it. Chunks of an upload may also be received by other processes, its hash
+# then has a gap and the upload is hashed from disk once complete. Abandoned uploads are
+# dropped, oldest first, past max_size
+class UploadHashes:
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.hashes = {}
+        self.lock = threading.Lock()
+
+    # a copy of the hash of the first offset bytes of the upload, None if they were not all seen
+    def get(self, upload_id, offset):
+        if offset == 0:
+            return hashlib.sha256()
+        with self.lock:
+            hashed_offset, sha = self.hashes.get(upload_id, (None, None))
+            return sha.copy() if hashed_offset == offset else None
+
+    def set(self, upload_id, offset, sha):
+        with self.lock:
+            self.hashes.pop(upload_id, None)
+            if sha is not None:
+                self.hashes[upload_id] = (offset, sha)
+                while len(self.hashes) > self.max_size:
+                    del self.hashes[next(iter(self.hashes))]
+
+    # the hex SHA-256 of the complete upload, if all of its size was hashed
+    def pop(self, upload_id, size):
+        with self.lock:
+            hashed_offset, sha = self.hashes.pop(upload_id, (None, None))
+        return sha.hexdigest() if hashed_offset == size else None
+
+
+upload_hashes = UploadHashes()
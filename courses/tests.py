@@ -1,3 +1,948 @@
-from django.test import TestCase
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import Permission, User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models.signals import m2m_changed
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from educa.db.backends.sqlite3.base import DatabaseWrapper
+from educa.middleware import InstrumentationMiddleware, ReplicaPinMiddleware
+from educa.routers import ReplicaRouter, primary, replica_reads
+from educa.testing import QueryBudgetMixin
+from embed_video.backends import VideoDoesntExistException
+from PIL import Image as PILImage
+from . import async_views
+from .api.views import CourseViewSet
+from .bulk import bulk_create_with_pks
+from .caching import get_enrolled_course_ids, get_or_build
+from .enrollment import bulk_enroll, read_usernames
+from .images import generate_variants, get_executor
+from .search import SearchBackend, SQLiteFTSBackend, get_backend
+from .storage import upload_hashes
+from .transfer import clone_course, export_course, import_course
+from .models import Subject, Course, Module, Content, Text, Video, File, Image, Upload
 
-# Create your tests here.
+
+# a course with a module holding a text and a video, its owner and an enrolled student
+class CourseTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user('instructor', password='password')
+        cls.student = User.objects.create_user('student', password='password')
+        cls.subject = Subject.objects.create(title='Mathematics', slug='mathematics')
+        cls.course = Course.objects.create(owner=cls.owner, subject=cls.subject, title='Algebra',
+                                           slug='algebra', overview='Equations')
+        cls.course.students.add(cls.student)
+        cls.module = Module.objects.create(course=cls.course, title='Linear equations')
+        for item in [Text(owner=cls.owner, title='Introduction', content='One unknown'),
+                     Video(owner=cls.owner, title='Example', url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')]:
+            item.save()
+            Content.objects.create(module=cls.module, item=item)
+
+    def setUp(self):
+        # nothing is served from what another test cached
+        cache.clear()
+
+
+class CourseAPIQueryBudgetTest(QueryBudgetMixin, CourseTestCase):
+    def test_course_list(self):
+        response = self.assertWithinQueryBudget(self.client.get, reverse('api:course-list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_list_logged_in(self):
+        self.client.force_login(self.student)
+        response = self.assertWithinQueryBudget(self.client.get, reverse('api:course-list'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_course_detail(self):
+        self.client.force_login(self.student)
+        response = self.assertWithinQueryBudget(self.client.get, reverse('api:course-detail', args=[self.course.id]))
+        self.assertEqual(response.json()['slug'], 'algebra')
+
+    def test_course_contents(self):
+        credentials = base64.b64encode(b'student:password').decode()
+        response = self.assertWithinQueryBudget(self.client.get, reverse('api:course-contents', args=[self.course.id]),
+                                                HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertEqual(len(response.json()['modules'][0]['contents']), 2)
+
+
+class ContentItemsTest(CourseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(5):
+            for item in [Text(owner=cls.owner, title=f'Text {i}', content=''),
+                         Video(owner=cls.owner, title=f'Video {i}', url='https://www.youtube.com/watch?v=dQw4w9WgXcQ')]:
+                item.save()
+                Content.objects.create(module=cls.module, item=item)
+
+    def test_with_items(self):
+        # the contents, then the items of each content type
+        with self.assertNumQueries(3):
+            titles = [content.item.title for content in self.module.contents.with_items()]
+        self.assertEqual(len(titles), 12)
+        # and the owners of all the items
+        with self.assertNumQueries(4):
+            owners = {content.item.owner for content in self.module.contents.with_items(owner=True)}
+        self.assertEqual(owners, {self.owner})
+
+    def test_content_list_view(self):
+        self.client.login(username='instructor', password='password')
+        url = reverse('module_content_list', args=[self.module.id])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        # more items of the same types add no queries
+        Content.objects.create(module=self.module, item=Text.objects.create(owner=self.owner, title='More', content=''))
+        with self.assertNumQueries(len(queries)):
+            response = self.client.get(url)
+        self.assertContains(response, 'More')
+
+
+@override_settings(CATALOG_PAGE_SIZE=1)
+class CourseListCursorTest(CourseTestCase):
+    def test_next_page(self):
+        newer = Course.objects.create(owner=self.owner, subject=self.subject, title='Geometry', slug='geometry')
+        response = self.client.get(reverse('course_list'))
+        self.assertEqual([course['id'] for course in response.context['courses']], [newer.id])
+        response = self.client.get(reverse('course_list'), {'cursor': response.context['next_cursor']})
+        self.assertEqual([course['id'] for course in response.context['courses']], [self.course.id])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_invalid_cursor(self):
+        for value in ['2020-01-01T00:00:00+00:00|' + '9' * 30, '2020-01-01T00:00:00+00:00|0',
+                      '2020-01-01T00:00:00|1', '0001-01-01T00:00:00+14:00|1', '2020-01-01', 'é']:
+            cursor = base64.urlsafe_b64encode(value.encode()).decode()
+            self.assertEqual(self.client.get(reverse('course_list'), {'cursor': cursor}).status_code, 404, value)
+        self.assertEqual(self.client.get(reverse('course_list'), {'cursor': 'abc'}).status_code, 404)
+
+    def test_cache_key_from_position(self):
+        value = '2020-01-01T02:00:00+02:00|1'
+        cursor = base64.urlsafe_b64encode(value.encode()).decode()
+        with mock.patch('courses.views.get_or_build', wraps=get_or_build) as build:
+            self.client.get(reverse('course_list'), {'cursor': cursor})
+        self.assertEqual(build.call_args_list[-1][0][0], 'all_courses_2020-01-01T00:00:00+00:00_1')
+
+
+# on the thread of the test, the worker threads cannot see the data of its transaction
+@override_settings(ASYNC_VIEWS_THREAD_SENSITIVE=True)
+class AsyncViewsTest(CourseTestCase):
+    def get_response(self, view, request, **kwargs):
+        request.user = self.student
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_get(self):
+        response = self.get_response(async_views.course_detail, RequestFactory().get('/'), slug='algebra')
+        self.assertContains(response.render(), 'Algebra')
+
+    # the methods the sync views don't handle are rejected the same way
+    def test_method_not_allowed(self):
+        self.assertEqual(self.get_response(async_views.course_list, RequestFactory().post('/')).status_code, 405)
+        response = self.get_response(async_views.course_detail, RequestFactory().post('/'), slug='algebra')
+        self.assertEqual(response.status_code, 405)
+
+
+class ReorderTest(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        # 300 contents, more than one UPDATE batch
+        texts = bulk_create_with_pks(Text(owner=self.owner, title=f'Text {i}', content='') for i in range(300))
+        Content.objects.bulk_create([Content(module=self.module, item=text) for text in texts])
+        self.ids = list(Content.objects.filter(module=self.module).order_by('order').values_list('id', flat=True))
+
+    def test_reorder(self):
+        orders = {id: order for order, id in enumerate(reversed(self.ids))}
+        # the locking SELECT, then one UPDATE per 250 rows, in a savepoint of the test's transaction
+        with self.assertNumQueries(5):
+            updated = Content.objects.filter(module__course__owner=self.owner).reorder(orders)
+        self.assertEqual(updated, len(self.ids))
+        self.assertEqual(dict(Content.objects.values_list('id', 'order')), orders)
+        # only the changed rows are written
+        with self.assertNumQueries(3):
+            self.assertEqual(Content.objects.reorder({self.ids[0]: orders[self.ids[0]]}), 0)
+
+    def test_view(self):
+        self.client.force_login(self.owner)
+        orders = {id: order for order, id in enumerate(reversed(self.ids))}
+        response = self.client.post(reverse('content_order'), json.dumps(orders), content_type='application/json')
+        self.assertEqual(response.json(), {'saved': 'OK', 'updated': len(self.ids)})
+        self.assertEqual(list(Content.objects.filter(module=self.module).values_list('id', flat=True)),
+                         list(reversed(self.ids)))
+        # the objects of other users are not reordered
+        self.client.force_login(self.student)
+        response = self.client.post(reverse('content_order'), json.dumps({self.ids[0]: 0}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse('module_order'), json.dumps({self.module.id: 5}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderFieldTest(CourseTestCase):
+    def create_module(self, **kwargs):
+        return Module.objects.create(course=self.course, title='Module', **kwargs)
+
+    def test_allocate(self):
+        self.assertEqual([self.create_module().order, self.create_module().order], [1, 2])
+        modules = Module.objects.bulk_create([Module(course=self.course, title='Module') for i in range(2)])
+        self.assertEqual([module.order for module in modules], [3, 4])
+
+    def test_after_explicit_order(self):
+        self.assertEqual(self.create_module(order=10).order, 10)
+        self.assertEqual(self.create_module().order, 11)
+
+    def test_after_reorder(self):
+        second = self.create_module()
+        Module.objects.reorder({second.id: 20})
+        self.assertEqual(self.create_module().order, 21)
+        modules = Module.objects.bulk_create([Module(course=self.course, title='Module')])
+        self.assertEqual(modules[0].order, 22)
+        # separate sequences per course
+        other = Course.objects.create(owner=self.owner, subject=self.subject, title='Geometry', slug='geometry')
+        self.assertEqual(Module.objects.create(course=other, title='Module').order, 0)
+
+
+@override_settings(ASYNC_VIEWS_THREAD_SENSITIVE=False)
+class AsyncViewsWorkerTest(TransactionTestCase):
+    def test_view_runs_in_worker_thread(self):
+        owner = User.objects.create_user('instructor')
+        subject = Subject.objects.create(title='Mathematics', slug='mathematics')
+        Course.objects.create(owner=owner, subject=subject, title='Algebra', slug='algebra')
+        request = RequestFactory().get('/')
+        request.user = owner
+        threads = []
+        with mock.patch('courses.async_views.close_old_connections',
+                        side_effect=lambda: threads.append(threading.get_ident())):
+            response = async_to_sync(async_views.course_detail)(request, slug='algebra')
+        # rendered in the worker, whose connections were checked before and after the view
+        self.assertTrue(response.is_rendered)
+        self.assertContains(response, 'Algebra')
+        self.assertEqual(len(threads), 2)
+        self.assertEqual(threads[0], threads[1])
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+
+@override_settings(INSTRUMENTATION_HEADERS=True, REPLICA_PIN_COOKIE='pin')
+class AsyncMiddlewareTest(SimpleTestCase):
+    def test_async_get_response(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = InstrumentationMiddleware(ReplicaPinMiddleware(get_response))
+        # awaited by the handler instead of being adapted with async_to_sync()
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(RequestFactory().post('/'))
+        self.assertEqual(response['X-Query-Count'], '0')
+        self.assertIn('pin', response.cookies)
+
+    def test_sync_get_response(self):
+        middleware = InstrumentationMiddleware(ReplicaPinMiddleware(lambda request: HttpResponse()))
+        self.assertFalse(asyncio.iscoroutinefunction(middleware))
+        response = middleware(RequestFactory().get('/'))
+        self.assertEqual(response['X-Query-Count'], '0')
+        self.assertNotIn('pin', response.cookies)
+
+
+class EnrollmentCacheTest(CourseTestCase):
+    def test_forgotten_on_commit(self):
+        self.assertEqual(get_enrolled_course_ids(self.student), {self.course.id})
+        with mock.patch('django.db.transaction.on_commit') as on_commit:
+            self.course.students.remove(self.student)
+        # kept until the transaction removing the student is committed
+        self.assertEqual(get_enrolled_course_ids(self.student), {self.course.id})
+        for call in on_commit.call_args_list:
+            call[0][0]()
+        self.assertEqual(get_enrolled_course_ids(self.student), frozenset())
+
+
+class GetOrBuildTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_lock_released_when_build_fails(self):
+        get_or_build('key', 1, lambda: 'first')
+        # version 2 is stale, this request takes the lock and its build fails
+        with self.assertRaises(ValueError):
+            get_or_build('key', 2, lambda: int('not a number'))
+        self.assertIsNone(cache.get('key:lock'))
+        self.assertEqual(get_or_build('key', 2, lambda: 'second'), 'second')
+
+
+# stands in for the video providers, see settings.VIDEO_EMBED_RESOLVER
+def resolve_stub_video(url):
+    resolve_stub_video.calls.append(url)
+    return {'provider': 'stub', 'embed_url': f'https://player.example.com/{url.rsplit("/", 1)[-1]}',
+            'thumbnail_url': 'https://img.example.com/thumbnail.jpg', 'width': 1920, 'height': 800}
+
+
+resolve_stub_video.calls = []
+
+
+def resolve_missing_video(url):
+    raise VideoDoesntExistException()
+
+
+@override_settings(VIDEO_EMBED_RESOLVER='courses.tests.resolve_stub_video')
+class VideoEmbedTest(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        resolve_stub_video.calls = []
+
+    def test_embed_resolved_on_save(self):
+        video = Video.objects.create(owner=self.owner, title='Lecture', url='https://videos.example.com/42')
+        video.refresh_from_db()
+        self.assertEqual(video.get_embed(), {
+            'source': 'https://videos.example.com/42', 'provider': 'stub',
+            'embed_url': 'https://player.example.com/42', 'thumbnail_url': 'https://img.example.com/thumbnail.jpg',
+            'width': 1920, 'height': 800,
+        })
+        self.assertEqual(resolve_stub_video.calls, ['https://videos.example.com/42'])
+
+    def test_embed_resolved_once(self):
+        video = Video.objects.create(owner=self.owner, title='Lecture', url='https://videos.example.com/42')
+        video.title = 'Renamed'
+        video.save()
+        self.assertEqual(len(resolve_stub_video.calls), 1)
+        video.url = 'https://videos.example.com/43'
+        video.save()
+        self.assertEqual(resolve_stub_video.calls[-1], 'https://videos.example.com/43')
+        self.assertEqual(video.get_embed()['embed_url'], 'https://player.example.com/43')
+
+    def test_render(self):
+        video = Video.objects.create(owner=self.owner, title='Lecture', url='https://videos.example.com/42')
+        resolve_stub_video.calls = []
+        html = Video.objects.get(pk=video.pk).render()
+        # 480 pixels wide, keeping the 1920x800 aspect ratio
+        self.assertInHTML('<iframe width="480" height="200" src="https://player.example.com/42" title="Lecture" '
+                          'loading="lazy" frameborder="0" allowfullscreen></iframe>', html)
+        self.assertEqual(resolve_stub_video.calls, [])
+
+    @override_settings(VIDEO_EMBED_RESOLVER='courses.tests.resolve_missing_video')
+    def test_unresolved_video_rendered_as_link(self):
+        with self.assertLogs('courses.video', 'WARNING'):
+            video = Video.objects.create(owner=self.owner, title='Lecture', url='https://videos.example.com/42')
+        self.assertEqual(video.get_embed(), {'source': 'https://videos.example.com/42'})
+        self.assertInHTML('<a href="https://videos.example.com/42" target="_blank" rel="noopener">Lecture</a>',
+                          video.render())
+
+
+class UploadTest(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name, UPLOAD_CHUNK_DIR=os.path.join(media.name, 'uploads'),
+                                     UPLOAD_MAX_SIZE=1000, UPLOAD_USER_QUOTA=1500)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.owner.user_permissions.add(Permission.objects.get(codename='add_content'))
+        self.client.login(username='instructor', password='password')
+
+    def create_upload(self, size):
+        return self.client.post(reverse('upload_create'), json.dumps({'filename': 'notes.pdf', 'size': size}),
+                                content_type='application/json')
+
+    def test_size_limits(self):
+        self.assertEqual(self.create_upload(1001).status_code, 413)
+        self.assertEqual(self.create_upload(1000).status_code, 201)
+        # 1000 bytes of the quota are reserved by the unfinished upload
+        self.assertEqual(self.create_upload(600).status_code, 413)
+        self.assertEqual(self.create_upload(500).status_code, 201)
+
+    def test_permission(self):
+        self.client.login(username='student', password='password')
+        self.assertEqual(self.create_upload(100).status_code, 403)
+
+    def put_chunks(self, upload_id, data, size, start=0, end=None):
+        for offset in range(start, len(data) if end is None else end, size):
+            chunk = data[offset:offset + size]
+            response = self.client.put(reverse('upload_chunk', args=[upload_id]), chunk,
+                                       content_type='application/octet-stream',
+                                       HTTP_CONTENT_RANGE=f'bytes {offset}-{offset + len(chunk) - 1}/{len(data)}')
+            self.assertEqual(response.status_code, 200)
+
+    def test_complete(self):
+        data = b'x' * 500 + b'y' * 300
+        upload = json.loads(self.create_upload(len(data)).content)
+        self.put_chunks(upload['id'], data, 300)
+        path = Upload.objects.get().path
+        # TestCase never commits, the callbacks run right away instead.
+        # The chunks were hashed as they were received, the file is not read again
+        with mock.patch('django.db.transaction.on_commit', lambda func: func()), \
+                mock.patch('courses.views.file_sha256') as file_sha256:
+            response = self.client.post(reverse('upload_complete', args=[upload['id']]),
+                                        json.dumps({'module_id': self.module.id, 'model_name': 'file'}),
+                                        content_type='application/json')
+        file_sha256.assert_not_called()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.content)['sha256'], hashlib.sha256(data).hexdigest())
+        self.assertEqual(File.objects.get().file.read(), data)
+        self.assertFalse(Upload.objects.exists())
+        self.assertFalse(os.path.exists(path))
+        # the upload is gone, so completing it again creates nothing
+        response = self.client.post(reverse('upload_complete', args=[upload['id']]),
+                                    json.dumps({'module_id': self.module.id, 'model_name': 'file'}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(File.objects.count(), 1)
+
+    def test_complete_hashed_elsewhere(self):
+        data = b'z' * 800
+        upload = json.loads(self.create_upload(len(data)).content)
+        self.put_chunks(upload['id'], data, 300, end=600)
+        # as if the first chunks had been received by another process
+        upload_hashes.set(uuid.UUID(upload['id']), 600, None)
+        self.put_chunks(upload['id'], data, 300, start=600)
+        response = self.client.post(reverse('upload_complete', args=[upload['id']]),
+                                    json.dumps({'module_id': self.module.id, 'model_name': 'file'}),
+                                    content_type='application/json')
+        self.assertEqual(json.loads(response.content)['sha256'], hashlib.sha256(data).hexdigest())
+
+    def test_clean_uploads(self):
+        self.create_upload(100)
+        self.create_upload(200)
+        stale, fresh = Upload.objects.order_by('size')
+        Upload.objects.filter(pk=stale.pk).update(updated=stale.updated - timedelta(days=2))
+        orphan = os.path.join(os.path.dirname(stale.path), 'orphan.part')
+        open(orphan, 'wb').close()
+        os.utime(orphan, (0, 0))
+        call_command('clean_uploads', stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(Upload.objects.all()), [fresh])
+        self.assertFalse(os.path.exists(stale.path))
+        self.assertTrue(os.path.exists(fresh.path))
+        self.assertFalse(os.path.exists(orphan))
+
+
+class SearchTest(CourseTestCase):
+    def search_texts(self, query, course_ids):
+        return [(result['id'], result['course'])
+                for result in get_backend().search(query, course_ids)[:] if result['type'] == 'text']
+
+    def test_text_in_several_courses(self):
+        text = Text.objects.get(title='Introduction')
+        other = Course.objects.create(owner=self.owner, subject=self.subject, title='Geometry', slug='geometry')
+        module = Module.objects.create(course=other, title='Lines')
+        content = Content.objects.create(module=module, item=text)
+        # only found for the students of either course
+        self.assertEqual(self.search_texts('unknown', []), [])
+        self.assertEqual(self.search_texts('unknown', [other.id]), [(text.id, other.id)])
+        self.assertEqual(self.search_texts('unknown', [self.course.id]), [(text.id, self.course.id)])
+        text.content = 'Two unknowns'
+        text.save()
+        self.assertEqual(len(self.search_texts('unknowns', [self.course.id, other.id])), 2)
+        content.delete()
+        self.assertEqual(self.search_texts('unknowns', [self.course.id, other.id]), [(text.id, self.course.id)])
+
+    def test_document_replaced(self):
+        # a copy, the instances of setUpTestData() are shared by the tests
+        course = Course.objects.get(pk=self.course.pk)
+        course.title = 'Linear algebra'
+        course.save()
+        results = get_backend().search('algebra')[:]
+        self.assertEqual([(result['type'], result['title']) for result in results], [('course', 'Linear algebra')])
+        with connection.cursor() as cursor:
+            # the rowids of the documents of an object are found without scanning the index
+            cursor.execute('EXPLAIN QUERY PLAN SELECT id FROM courses_search_document '
+                           'WHERE doc_type = %s AND object_id = %s', ['course', course.id])
+            self.assertIn('INDEX courses_search_document_object', str(cursor.fetchall()))
+            cursor.execute('SELECT count(*) FROM courses_search_document')
+            documents = cursor.fetchone()[0]
+            cursor.execute('SELECT count(*) FROM courses_search_index')
+            self.assertEqual(cursor.fetchone()[0], documents)
+        course.delete()
+        self.assertEqual(get_backend().search('algebra').count(), 0)
+
+    def test_backend_setting(self):
+        with override_settings(SEARCH_BACKEND='courses.search.SearchBackend'):
+            self.assertIs(type(get_backend()), SearchBackend)
+        self.assertIs(type(get_backend()), SQLiteFTSBackend)
+
+
+class BulkEnrollTest(CourseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.users = [User.objects.create_user(f'user{i}') for i in range(3)]
+
+    def setUp(self):
+        super().setUp()
+        # pk_set of every m2m_changed signal of the students
+        self.changes = []
+        receiver = lambda action, pk_set, **kwargs: self.changes.append((action, pk_set))
+        m2m_changed.connect(receiver, sender=Course.students.through, weak=False, dispatch_uid='bulk_enroll_test')
+        self.addCleanup(m2m_changed.disconnect, sender=Course.students.through, dispatch_uid='bulk_enroll_test')
+
+    def test_read_usernames(self):
+        lines = io.StringIO('Username,email\nuser0,a@example.com\n\n user1 ,b@example.com\n,c@example.com\n')
+        self.assertEqual(list(read_usernames(lines)), ['user0', 'user1'])
+
+    def test_enroll(self):
+        batches = list(bulk_enroll(self.course, ['student', 'user0', 'user1', 'nobody', 'user2'], chunk_size=2))
+        self.assertEqual([(batch['users'], batch['changed'], batch['missing']) for batch in batches],
+                         [(2, 1, []), (1, 1, ['nobody']), (1, 1, [])])
+        self.assertEqual(set(self.course.students.all()), {self.student, *self.users})
+        # signals only name the users that were not enrolled yet
+        self.assertEqual(self.changes[:2], [('pre_add', {self.users[0].id}), ('post_add', {self.users[0].id})])
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_students, 4)
+
+    def test_enroll_nobody_new(self):
+        batch, = bulk_enroll(self.course, ['student', 'nobody'])
+        self.assertEqual((batch['users'], batch['changed'], batch['rows_per_second']), (1, 0, 0))
+        self.assertEqual(self.changes, [])
+
+    def test_unenroll(self):
+        batch, = bulk_enroll(self.course, ['student', 'user0'], unenroll=True)
+        self.assertEqual((batch['users'], batch['changed']), (2, 1))
+        self.assertEqual(self.changes, [('pre_remove', {self.student.id}), ('post_remove', {self.student.id})])
+        self.assertFalse(self.course.students.exists())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.total_students, 0)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('bulk_enroll', 'algebra', 'student', 'user0', 'nobody', stdout=out)
+        self.assertIn('Enrolled 1 users on "Algebra", 1 usernames not found.', out.getvalue())
+
+    def test_api(self):
+        self.client.force_login(self.owner)
+        response = self.client.post(f'/api/courses/{self.course.id}/students/', {'usernames': ['user0', 'nobody']},
+                                    content_type='application/json',
+                                    HTTP_AUTHORIZATION='Basic ' + base64.b64encode(b'instructor:password').decode())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['enrolled'], response.json()['missing']), (1, ['nobody']))
+
+
+class CountersTest(CourseTestCase):
+    def counters(self):
+        subject = Subject.objects.get(pk=self.subject.pk)
+        course = Course.objects.get(pk=self.course.pk)
+        return subject.total_courses, course.total_modules, course.total_students
+
+    def test_create(self):
+        self.assertEqual(self.counters(), (1, 1, 1))
+        Course.objects.create(owner=self.owner, subject=self.subject, title='Geometry', slug='geometry')
+        Module.objects.create(course=self.course, title='Quadratic equations')
+        self.assertEqual(self.counters(), (2, 2, 1))
+
+    def test_move_course(self):
+        other = Subject.objects.create(title='Physics', slug='physics')
+        course = Course.objects.get(pk=self.course.pk)
+        course.subject = other
+        course.save()
+        self.assertEqual(Subject.objects.get(pk=self.subject.pk).total_courses, 0)
+        self.assertEqual(Subject.objects.get(pk=other.pk).total_courses, 1)
+
+    def test_delete(self):
+        Module.objects.create(course=self.course, title='Quadratic equations')
+        Module.objects.filter(pk=self.module.pk).delete()
+        self.assertEqual(self.counters(), (1, 1, 1))
+
+    def test_delete_course(self):
+        for i in range(3):
+            Module.objects.create(course=self.course, title=f'Module {i}')
+        with CaptureQueriesContext(connection) as queries:
+            Course.objects.get(pk=self.course.pk).delete()
+        # the modules of the deleted course are not recounted one by one
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "courses_course"')])
+        self.assertEqual(Subject.objects.get(pk=self.subject.pk).total_courses, 0)
+        # later module deletions are counted again
+        course = Course.objects.create(owner=self.owner, subject=self.subject, title='Geometry', slug='geometry')
+        for module in [Module.objects.create(course=course, title=f'Module {i}') for i in range(2)]:
+            module.delete()
+        self.assertEqual(Course.objects.get(pk=course.pk).total_modules, 0)
+
+    def test_enroll(self):
+        user = User.objects.create_user('another')
+        course = Course.objects.get(pk=self.course.pk)
+        course.students.add(user)
+        self.assertEqual(self.counters(), (1, 1, 2))
+        # removing a user that is not enrolled changes nothing
+        course.students.remove(user, User.objects.create_user('stranger'))
+        self.assertEqual(self.counters(), (1, 1, 1))
+        self.student.courses_joined.clear()
+        self.assertEqual(self.counters(), (1, 1, 0))
+
+
+class ItemRenderCacheTest(CourseTestCase):
+    def test_render_cached(self):
+        text = Text.objects.get(title='Introduction')
+        with mock.patch('courses.models.render_to_string', return_value='<p>One unknown</p>') as render:
+            self.assertEqual(text.render(), '<p>One unknown</p>')
+            self.assertEqual(Text.objects.get(pk=text.pk).render(), '<p>One unknown</p>')
+            self.assertEqual(render.call_count, 1)
+            # an edit or new templates render the item again
+            text.content = 'Two unknowns'
+            text.save()
+            text.render()
+            self.assertEqual(render.call_count, 2)
+            with override_settings(ITEM_RENDER_CACHE_VERSION='2'):
+                text.render()
+            self.assertEqual(render.call_count, 3)
+
+
+class MediaTest(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.client.login(username='student', password='password')
+        self.url = self.add_file(b'0123456789')
+
+    def add_file(self, data):
+        item = File(owner=self.owner, title='Notes')
+        item.file.save('notes.txt', ContentFile(data))
+        Content.objects.create(module=self.module, item=item)
+        return reverse('media', args=[item.file.name])
+
+    def get(self, url=None, **headers):
+        response = self.client.get(url or self.url, **headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_range(self):
+        response, content = self.get(HTTP_RANGE='bytes=2-4')
+        self.assertEqual((response.status_code, content, response['Content-Range']), (206, b'234', 'bytes 2-4/10'))
+        response, content = self.get(HTTP_RANGE='bytes=-3')
+        self.assertEqual((response.status_code, content), (206, b'789'))
+        response, content = self.get(HTTP_RANGE='bytes=8-20')
+        self.assertEqual((response.status_code, content), (206, b'89'))
+        # an end before the start makes the header invalid, it is ignored
+        response, content = self.get(HTTP_RANGE='bytes=5-2')
+        self.assertEqual((response.status_code, content), (200, b'0123456789'))
+        response, content = self.get(HTTP_RANGE='bytes=10-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+
+    def test_empty_file(self):
+        url = self.add_file(b'')
+        for header in ['bytes=-5', 'bytes=0-']:
+            response, content = self.get(url, HTTP_RANGE=header)
+            self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */0'))
+        self.assertEqual(self.get(url)[0].status_code, 200)
+
+    def test_conditional(self):
+        response, content = self.get()
+        etag = response['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag)[0].status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])[0].status_code, 304)
+        self.assertEqual(self.get(HTTP_IF_MATCH='"other"')[0].status_code, 412)
+        # a range of another version of the file is answered with the whole current one
+        response, content = self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"other"')
+        self.assertEqual((response.status_code, content), (200, b'0123456789'))
+        response, content = self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, content), (206, b'01'))
+
+    def test_access_denied(self):
+        self.client.logout()
+        self.assertEqual(self.get()[0].status_code, 404)
+        User.objects.create_user('stranger', password='password')
+        self.client.login(username='stranger', password='password')
+        self.assertEqual(self.get()[0].status_code, 404)
+        self.assertEqual(self.get(reverse('media', args=['../educa/settings.py']))[0].status_code, 404)
+        self.client.login(username='instructor', password='password')
+        self.assertEqual(self.get()[0].status_code, 200)
+
+
+class ImageVariantsTest(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.image = Image(owner=self.owner, title='Photo')
+        output = io.BytesIO()
+        PILImage.new('RGB', (800, 600)).save(output, 'PNG')
+        self.image.file.save('photo.png', ContentFile(output.getvalue()))
+
+    def test_generate_variants(self):
+        storage, name = self.image.file.storage, self.image.file.name
+        variants = generate_variants(storage, name, [320, 640, 1280], 80)
+        root = os.path.splitext(name)[0]
+        self.assertEqual(variants, {'source': name, 'width': 800, 'height': 600,
+                                    'widths': {'320': f'{root}.w320.jpg', '640': f'{root}.w640.jpg'}})
+        with storage.open(variants['widths']['320']) as f, PILImage.open(f) as variant:
+            self.assertEqual(variant.size, (320, 240))
+        # regenerated variants replace the previous files
+        self.assertEqual(generate_variants(storage, name, [320, 640, 1280], 80), variants)
+
+    def test_worker_process(self):
+        future = get_executor().submit(generate_variants, self.image.file.storage, self.image.file.name, [320], 80)
+        self.assertEqual(list(future.result(timeout=60)['widths']), ['320'])
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    # the databases the router reads Course and Session rows from while the request is handled
+    def read_dbs(self, request, view=None):
+        @replica_reads
+        def read_view(request):
+            return self.router.db_for_read(Course), self.router.db_for_read(Session)
+        return (view or read_view)(request)
+
+    def test_reads(self):
+        self.assertEqual(self.router.db_for_read(Course), 'default')
+        self.assertEqual(self.read_dbs(self.factory.get('/')), ('replica', 'default'))
+        self.assertEqual(self.router.db_for_write(Course), 'default')
+        self.assertFalse(self.router.allow_migrate('replica', 'courses'))
+
+    def test_primary(self):
+        self.assertEqual(self.read_dbs(self.factory.post('/')), ('default', 'default'))
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(self.read_dbs(request), ('default', 'default'))
+
+        @replica_reads
+        def cached_view(request):
+            with primary():
+                return self.router.db_for_read(Course)
+        self.assertEqual(cached_view(self.factory.get('/')), 'default')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(self.read_dbs(self.factory.get('/')), ('default', 'default'))
+
+    def test_async_view(self):
+        @replica_reads
+        async def read_view(request):
+            return await sync_to_async(self.router.db_for_read)(Course)
+        self.assertEqual(async_to_sync(read_view)(self.factory.get('/')), 'replica')
+
+    def test_pin(self):
+        middleware = ReplicaPinMiddleware(lambda request: HttpResponse())
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, middleware(self.factory.get('/')).cookies)
+        cookie = middleware(self.factory.post('/')).cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.REPLICA_PIN_SECONDS)
+
+
+class SQLiteBackendTest(SimpleTestCase):
+    def test_connection(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'db.sqlite3')
+        db = DatabaseWrapper({**connection.settings_dict, 'NAME': path}, alias='backend_test')
+        self.addCleanup(db.close)
+        with db.cursor() as cursor:
+            for name, value in [('journal_mode', 'wal'), ('synchronous', 1), ('busy_timeout', 5000)]:
+                cursor.execute(f'PRAGMA {name}')
+                self.assertEqual(cursor.fetchone()[0], value)
+        # transactions hold the write lock from their start
+        db._start_transaction_under_autocommit()
+        other = sqlite3.connect(path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+            other.execute('BEGIN IMMEDIATE')
+        db.connection.rollback()
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+
+class BulkCreateTest(TestCase):
+    def test_pks(self):
+        deleted = Subject.objects.create(title='a', slug='a').pk
+        Subject.objects.filter(pk=deleted).delete()
+        subjects = bulk_create_with_pks(Subject(title=title, slug=title) for title in ['b', 'c'])
+        # the id of the deleted subject is not given out again
+        self.assertEqual([subject.pk for subject in subjects], [deleted + 1, deleted + 2])
+        self.assertEqual(list(Subject.objects.order_by('pk').values_list('pk', 'slug')),
+                         [(deleted + 1, 'b'), (deleted + 2, 'c')])
+        self.assertEqual(Subject.objects.create(title='d', slug='d').pk, deleted + 3)
+
+    def test_empty_table(self):
+        owner = User.objects.create_user('owner')
+        texts = bulk_create_with_pks(Text(owner=owner, title=str(i), content='') for i in range(3))
+        self.assertEqual(list(Text.objects.order_by('pk').values_list('pk', flat=True)), [text.pk for text in texts])
+
+
+@override_settings(INSTRUMENTATION_HEADERS=True)
+class InstrumentationTest(CourseTestCase):
+    def test_headers(self):
+        self.client.force_login(self.student)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('course_list'))
+        self.assertEqual(response['X-Query-Count'], str(len(queries)))
+        self.assertIn('cache;desc="0 hits', response['Server-Timing'])
+        self.assertRegex(response['Server-Timing'], r'render;dur=(?!0\.00)')
+        # the rows are served from the cache the second time
+        first = int(response['X-Query-Count'])
+        response = self.client.get(reverse('course_list'))
+        self.assertNotIn('cache;desc="0 hits', response['Server-Timing'])
+        self.assertLess(int(response['X-Query-Count']), first)
+
+    def test_budget(self):
+        response = self.client.get(reverse('api:course-list'))
+        self.assertEqual(response['X-Query-Budget'], str(CourseViewSet.list.query_budget))
+        with mock.patch('educa.middleware.get_query_budget', return_value=0), \
+                self.assertLogs('educa.metrics', 'WARNING') as logs:
+            self.client.get(reverse('course_list'))
+        self.assertIn('its budget is 0', logs.output[0])
+
+    def test_metrics_view(self):
+        self.client.get(reverse('course_list'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        User.objects.create_user('staff', password='password', is_staff=True)
+        self.client.login(username='staff', password='password')
+        routes = self.client.get(reverse('metrics')).json()['routes']
+        self.assertGreaterEqual(routes['']['requests'], 1)
+
+
+# a second module holding a file, and the outline copies of the course are compared by
+class CourseCopyTestCase(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        module = Module.objects.create(course=self.course, title='Quadratic equations', description='Squares')
+        item = File(owner=self.owner, title='Exercises')
+        item.file.save('exercises.pdf', ContentFile(b'%PDF exercises'))
+        Content.objects.create(module=module, item=item)
+
+    # modules and contents of a course, with the fields of their items
+    def outline(self, course):
+        return [(module.title, module.description, module.order,
+                 [(content.content_type.model, content.order, content.item.title,
+                   content.item.file.read() if isinstance(content.item, File) else
+                   getattr(content.item, 'content', getattr(content.item, 'url', None)))
+                  for content in module.contents.with_items()])
+                for module in Course.objects.get(pk=course.pk).modules.all()]
+
+
+class ExportImportTest(CourseCopyTestCase):
+    def test_round_trip(self):
+        lines = list(export_course(Course.objects.get(pk=self.course.pk)))
+        course = import_course(lines, self.student, slug='algebra-copy', batch_size=1)
+        self.assertEqual((course.owner, course.subject, course.title), (self.student, self.subject, 'Algebra'))
+        self.assertEqual(self.outline(course), self.outline(self.course))
+        self.assertEqual(Course.objects.get(pk=course.pk).total_modules, 2)
+        # exporting the import gives the same lines, but for the ids and slug
+        self.assertEqual(self.without_ids(export_course(course)), self.without_ids(lines))
+
+    def without_ids(self, lines):
+        return [{key: value for key, value in json.loads(line).items() if key not in ('id', 'module', 'item', 'slug')}
+                for line in lines]
+
+    def test_commands(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'algebra.jsonl')
+        call_command('export_course', 'algebra', output=path, stdout=io.StringIO())
+        call_command('import_course', path, owner='student', slug='algebra-copy', stdout=io.StringIO())
+        self.assertEqual(self.outline(Course.objects.get(slug='algebra-copy')), self.outline(self.course))
+
+    def test_invalid(self):
+        with self.assertRaisesMessage(ValueError, 'already exists'):
+            import_course(export_course(self.course), self.student)
+        with self.assertRaisesMessage(ValueError, 'Line 2'):
+            import_course([next(export_course(self.course)), '{"type": "module"}'], self.student, slug='broken')
+        self.assertFalse(Course.objects.filter(slug='broken').exists())
+
+
+class CloneCourseTest(CourseCopyTestCase):
+    def clone(self, slug):
+        return clone_course(Course.objects.get(pk=self.course.pk), self.owner, 'Algebra again', slug)
+
+    def test_clone(self):
+        clone = self.clone('algebra-again')
+        self.assertEqual(self.outline(clone), self.outline(self.course))
+        self.assertFalse(clone.students.exists())
+        clone = Course.objects.get(pk=clone.pk)
+        self.assertEqual((clone.total_modules, clone.total_students), (2, 0))
+        # the items are copied, their files are shared
+        old, new = [File.objects.get(id=Content.objects.get(module__course=course, content_type__model='file').object_id)
+                    for course in (self.course, clone)]
+        self.assertNotEqual(old.pk, new.pk)
+        self.assertEqual(old.file.name, new.file.name)
+
+    def test_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.clone('algebra-again')
+        count = len(queries)
+        # a larger course is cloned with as many queries
+        for i in range(3):
+            module = Module.objects.create(course=self.course, title=f'Module {i}')
+            Content.objects.create(module=module, item=Text.objects.create(owner=self.owner, title=str(i), content=''))
+        with self.assertNumQueries(count):
+            self.clone('algebra-bigger')
+
+    def test_view(self):
+        url = reverse('course_clone', args=[self.course.id])
+        self.client.login(username='instructor', password='password')
+        self.assertEqual(self.client.post(url, {'title': 'Algebra 2', 'slug': 'algebra-2'}).status_code, 403)
+        self.owner.user_permissions.add(Permission.objects.get(codename='add_course'))
+        response = self.client.post(url, {'title': 'Algebra 2', 'slug': 'algebra-2'})
+        self.assertRedirects(response, reverse('course_module_update', args=[Course.objects.get(slug='algebra-2').id]))
+        # only the owner can clone a course
+        self.client.login(username='student', password='password')
+        self.assertEqual(self.client.post(url, {'title': 'Algebra 3', 'slug': 'algebra-3'}).status_code, 403)
+
+
+class BenchmarkURLsTest(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'baseline.json')
+        # the baseline the other runs are compared with
+        self.benchmark('')
+        with open(self.path) as f:
+            self.report = json.load(f)
+
+    # runs the command, saving its results over the baseline like when the baseline is updated
+    def benchmark(self, baseline):
+        out = io.StringIO()
+        call_command('benchmark_urls', repeat=1, output=self.path, baseline=baseline, stdout=out)
+        return out.getvalue()
+
+    def save_baseline(self):
+        with open(self.path, 'w') as f:
+            json.dump(self.report, f)
+
+    def test_baseline(self):
+        results = self.report['results']
+        self.assertEqual(results['course_list']['status'], 200)
+        self.assertEqual(results['api:course-contents']['url'], f'/api/courses/{self.course.id}/contents/')
+        # nothing done by the benchmark is kept
+        self.assertFalse(User.objects.get(pk=self.owner.pk).is_superuser)
+        self.assertIn('No regressions', self.benchmark(self.path))
+
+    def test_regressions(self):
+        results = self.report['results']
+        cold = results['course_list']['queries_cold']
+        results['course_list']['queries_cold'] = cold - 1
+        results['api:course-list']['status'] = 404
+        self.save_baseline()
+        with self.assertRaises(CommandError) as error:
+            self.benchmark(self.path)
+        self.assertIn(f'course_list: queries_cold {cold - 1} -> {cold}', str(error.exception))
+        self.assertIn('api:course-list: status 404 -> 200', str(error.exception))
+
+    def test_url_missing_from_baseline(self):
+        del self.report['results']['course_list']
+        self.save_baseline()
+        with self.assertRaisesMessage(CommandError, 'course_list: not in the baseline'):
+            self.benchmark(self.path)
@@ -0,0 +1,302 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from .models import Subject, Course, Module, Content, Text, File, Image, Video
+from .bulk import bulk_create_with_pks
+from .counters import recount_subjects, recount_courses
+from .caching import CATALOG_VERSION_KEY, course_version_key, module_version_key, bump_version, reset_versions
+from .images import schedule_variants
+from .search import get_backend
+from .storage import HashedTemporaryFile, file_sha256
+
+# version of the JSON Lines format written by export_course()
+FORMAT_VERSION = 1
+
+# exported fields of every item model, besides the title
+ITEM_FIELDS = {'text': ['content'], 'video': ['url', 'embed'], 'image': ['file'], 'file': ['file']}
+ITEM_MODELS = {'text': Text, 'video': Video, 'image': Image, 'file': File}
+
+# bytes of a media file carried by each chunk line
+MEDIA_CHUNK_SIZE = 512 * 1024
+
+
+def dump(record):
+    return json.dumps(record, separators=(',', ':')) + '\n'
+
+
+# items of a model used by the contents of a course
+def get_course_items(course, model):
+    return model.objects.filter(id__in=Content.objects.filter(
+        module__course=course, content_type=ContentType.objects.get_for_model(model)).values('object_id'))
+
+
+# yields a course as JSON Lines, in the order import_course() needs them: the course, its
+# modules, the media files (a media line followed by base64 chunk lines), the items and
+# the contents. Rows are read with iterator() and files in chunks, so memory stays flat.
+# Media files missing from the storage are left out and their names added to the missing list
+def export_course(course, missing=None):
+    yield dump({'type': 'course', 'version': FORMAT_VERSION,
+                'subject': {'title': course.subject.title, 'slug': course.subject.slug},
+                'title': course.title, 'slug': course.slug, 'overview': course.overview})
+    for module in course.modules.order_by('order').iterator():
+        yield dump({'type': 'module', 'id': module.id, 'title': module.title,
+                    'description': module.description, 'order': module.order})
+    for model_name in ('image', 'file'):
+        model = ITEM_MODELS[model_name]
+        storage = model._meta.get_field('file').storage
+        # content-addressed files are shared by identical items, they are sent once
+        for name in get_course_items(course, model).values_list('file', flat=True).distinct().iterator():
+            try:
+                f = storage.open(name)
+            except FileNotFoundError:
+                if missing is not None:
+                    missing.append(name)
+                continue
+            with f:
+                # files stored before the content-addressed storage are not named after their hash
+                yield dump({'type': 'media', 'model': model_name, 'name': name, 'size': f.size,
+                            'sha256': file_sha256(f)})
+                for chunk in f.chunks(MEDIA_CHUNK_SIZE):
+                    yield dump({'type': 'chunk', 'data': base64.b64encode(chunk).decode()})
+    for model_name, model in ITEM_MODELS.items():
+        for item in get_course_items(course, model).iterator():
+            record = {'type': 'item', 'model': model_name, 'id': item.id, 'title': item.title}
+            for field in ITEM_FIELDS[model_name]:
+                record[field] = str(getattr(item, field))
+            yield dump(record)
+    contents = Content.objects.filter(module__course=course).select_related('content_type') \
+        .order_by('module__order', 'order')
+    for content in contents.iterator():
+        yield dump({'type': 'content', 'module': content.module_id, 'model': content.content_type.model,
+                    'item': content.object_id, 'order': content.order})
+
+
+# receives the chunks of one media file into a temporary file and stores it under its hash
+class MediaReceiver:
+    def __init__(self, record):
+        self.model = ITEM_MODELS[record['model']]
+        self.field = self.model._meta.get_field('file')
+        self.sha256 = record['sha256']
+        self.size = record['size']
+        self.source_name = record['name']
+        # the name the content-addressed storage gives the file, e.g. files/3a/3a7b...9f.pdf
+        self.upload_name = self.field.generate_filename(None, os.path.basename(record['name']))
+        self.name = self.field.storage.get_hashed_name(self.upload_name, self.sha256)
+        # identical files are stored once, skip the chunks of files already there
+        self.skip = self.field.storage.exists(self.name)
+        self.hash = hashlib.sha256()
+        self.received = 0
+        self.file = None if self.skip else tempfile.NamedTemporaryFile(delete=False)
+
+    def write(self, data):
+        if not self.skip:
+            chunk = base64.b64decode(data)
+            self.hash.update(chunk)
+            self.received += len(chunk)
+            self.file.write(chunk)
+
+    def save(self):
+        if self.skip:
+            return self.name
+        self.file.close()
+        try:
+            if self.received != self.size or self.hash.hexdigest() != self.sha256:
+                raise ValueError(f'Media file {self.source_name} is incomplete or corrupted.')
+            with HashedTemporaryFile(self.file.name, self.upload_name, self.sha256) as content:
+                return self.field.storage.save(self.upload_name, content)
+        finally:
+            if os.path.exists(self.file.name):
+                os.remove(self.file.name)
+
+
+# creates the rows of an exported course record by record. Modules are created before the
+# first row that needs them, items and contents in batches, all with bulk_create()
+class CourseImporter:
+    def __init__(self, course, owner, batch_size):
+        self.course = course
+        self.owner = owner
+        self.batch_size = batch_size
+        # exported module id -> Module
+        self.modules = {}
+        self.modules_saved = False
+        # exported media name -> stored name
+        self.media = {}
+        self.receiver = None
+        # exported item id -> created item id, per model
+        self.items = {model_name: {} for model_name in ITEM_MODELS}
+        self.pending_items = {model_name: [] for model_name in ITEM_MODELS}
+        self.pending_contents = []
+
+    def add(self, record):
+        handler = getattr(self, f'add_{record["type"]}', None)
+        if handler is None:
+            raise ValueError(f'Unknown record type {record["type"]}.')
+        handler(record)
+
+    def add_module(self, record):
+        self.modules[record['id']] = Module(course=self.course, title=record['title'],
+                                            description=record['description'], order=record['order'])
+
+    def save_modules(self):
+        if not self.modules_saved:
+            bulk_create_with_pks(self.modules.values())
+            self.modules_saved = True
+
+    def add_media(self, record):
+        self.save_media()
+        self.receiver = MediaReceiver(record)
+
+    def add_chunk(self, record):
+        if self.receiver is None:
+            raise ValueError('Chunk outside of a media file.')
+        self.receiver.write(record['data'])
+
+    def save_media(self):
+        if self.receiver is not None:
+            self.media[self.receiver.source_name] = self.receiver.save()
+            self.receiver = None
+
+    def add_item(self, record):
+        self.save_media()
+        model_name = record['model']
+        fields = {field: record[field] for field in ITEM_FIELDS[model_name]}
+        if 'file' in fields:
+            # files missing when the course was exported keep their name
+            fields['file'] = self.media.get(fields['file'], fields['file'])
+        self.pending_items[model_name].append(
+            (record['id'], ITEM_MODELS[model_name](owner=self.owner, title=record['title'], **fields)))
+        if len(self.pending_items[model_name]) >= self.batch_size:
+            self.save_items(model_name)
+
+    def save_items(self, model_name):
+        pending = self.pending_items[model_name]
+        bulk_create_with_pks(obj for _, obj in pending)
+        self.items[model_name].update((id, obj.pk) for id, obj in pending)
+        pending.clear()
+
+    def add_content(self, record):
+        self.save_modules()
+        model_name = record['model']
+        # all the items come before the contents
+        if self.pending_items[model_name]:
+            self.save_items(model_name)
+        self.pending_contents.append(Content(
+            module=self.modules[record['module']], order=record['order'],
+            content_type=ContentType.objects.get_for_model(ITEM_MODELS[model_name]),
+            object_id=self.items[model_name][record['item']]))
+        if len(self.pending_contents) >= self.batch_size:
+            self.save_contents()
+
+    def save_contents(self):
+        Content.objects.bulk_create(self.pending_contents)
+        self.pending_contents.clear()
+
+    def finish(self):
+        self.save_modules()
+        self.save_media()
+        for model_name in ITEM_MODELS:
+            self.save_items(model_name)
+        self.save_contents()
+
+    # removes the temporary file of an interrupted media file
+    def close(self):
+        if self.receiver is not None and self.receiver.file is not None:
+            self.receiver.file.close()
+            if os.path.exists(self.receiver.file.name):
+                os.remove(self.receiver.file.name)
+
+
+# rebuilds a course exported by export_course() from an iterable of lines, in one transaction,
+# and returns it. Raises ValueError for malformed input
+def import_course(lines, owner, slug=None, batch_size=1000):
+    lines = iter(lines)
+    try:
+        header = json.loads(next(lines))
+    except (StopIteration, ValueError):
+        raise ValueError('The first line must describe the course.')
+    if header.get('type') != 'course' or header.get('version') != FORMAT_VERSION:
+        raise ValueError(f'Not a course export of version {FORMAT_VERSION}.')
+    slug = slug or header['slug']
+    if Course.objects.filter(slug=slug).exists():
+        raise ValueError(f'A course with the slug "{slug}" already exists.')
+    with transaction.atomic():
+        subject, _ = Subject.objects.get_or_create(slug=header['subject']['slug'],
+                                                   defaults={'title': header['subject']['title']})
+        course = Course.objects.create(owner=owner, subject=subject, title=header['title'], slug=slug,
+                                       overview=header['overview'])
+        importer = CourseImporter(course, owner, batch_size)
+        try:
+            for number, line in enumerate(lines, start=2):
+                if not line.strip():
+                    continue
+                try:
+                    importer.add(json.loads(line))
+                except (KeyError, TypeError, ValueError, AttributeError) as e:
+                    raise ValueError(f'Line {number}: {e}')
+            importer.finish()
+        finally:
+            importer.close()
+        finish_bulk_course(course)
+    return course
+
+
+# copies a course with its modules, contents and items for a new owner, e.g. to run it
+# again next term. Every table is read once and written with bulk inserts, so the number of
+# queries does not grow with the course. Files and image variants are shared, not copied
+def clone_course(course, owner, title, slug):
+    with transaction.atomic():
+        clone = Course.objects.create(owner=owner, subject=course.subject, title=title, slug=slug,
+                                      overview=course.overview)
+        # the orders are copied, so the clone lists modules and contents like the course
+        modules = {}
+        for module in course.modules.all():
+            modules[module.id] = module
+            module.pk = None
+            module.course = clone
+        bulk_create_with_pks(modules.values())
+        # old item id -> new item id, per content type
+        items = {}
+        for model in ITEM_MODELS.values():
+            content_type = ContentType.objects.get_for_model(model)
+            objs = list(get_course_items(course, model))
+            old_ids = [obj.pk for obj in objs]
+            for obj in objs:
+                obj.pk = None
+                obj.owner = owner
+            bulk_create_with_pks(objs)
+            items[content_type.id] = {old_id: obj.pk for old_id, obj in zip(old_ids, objs)}
+        Content.objects.bulk_create(
+            Content(module=modules[content.module_id], content_type_id=content.content_type_id,
+                    object_id=items[content.content_type_id][content.object_id], order=content.order)
+            for content in Content.objects.filter(module__course=course))
+        finish_bulk_course(clone)
+    return clone
+
+
+# bulk inserts send no signals, does what their handlers do for the modules,
+# contents and items of a course created that way
+def finish_bulk_course(course):
+    recount_courses([course.id])
+    recount_subjects([course.subject_id])
+    bump_version(CATALOG_VERSION_KEY)
+    bump_version(course_version_key(course.id))
+    modules = list(course.modules.all())
+    reset_versions(module_version_key(module.id) for module in modules)
+    backend = get_backend()
+    backend.add(('module', module.id, course.id, module.title, module.description) for module in modules)
+    backend.add(('text', text.id, course.id, text.title, text.content)
+                for text in get_course_items(course, Text).iterator())
+    # variants only depend on the file, files stored before keep the variants they have
+    images = get_course_items(course, Image).filter(variants='')
+    for name in images.values_list('file', flat=True).distinct():
+        known = Image.objects.filter(file=name, variants__contains=f'"source": {json.dumps(name)}') \
+            .values_list('variants', flat=True).first()
+        if known:
+            images.filter(file=name).update(variants=known)
+        else:
+            for image in images.filter(file=name):
+                schedule_variants(image)
@@ -1,5 +1,6 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
      path('mine/', views.ManageCourseListView.as_view(), name='manage_course_list'),
@@ -10,6 +11,8 @@ urlpatterns = [
 
      path('<pk>/delete/', views.CourseDeleteView.as_view(), name='course_delete'),
 
+     path('<pk>/clone/', views.CourseCloneView.as_view(), name='course_clone'),
+
      path('<pk>/module/', views.CourseModuleUpdateView.as_view(),
           name='course_module_update'),
      # create new text, vido, image, file objects and add them to a module
@@ -27,8 +30,18 @@ urlpatterns = [
      path('module/order/', views.ModuleOrderView.as_view(), name='module_order'),
 
      path('content/order/', views.ContentOrderView.as_view(), name='content_order'),
+     # chunked, resumable uploads of files and images
+     path('upload/', views.UploadCreateView.as_view(), name='upload_create'),
+
+     path('upload/<uuid:upload_id>/', views.UploadChunkView.as_view(), name='upload_chunk'),
+
+     path('upload/<uuid:upload_id>/complete/', views.UploadCompleteView.as_view(), name='upload_complete'),
      # displays all courses for a subject
-     path('subject/<slug:subject>/', views.CourseListView.as_view(), name='course_list_subject'),
+     path('subject/<slug:subject>/',
+          async_views.course_list if settings.ASYNC_VIEWS else views.CourseListView.as_view(),
+          name='course_list_subject'),
      # displays a single course overview
-     path('<slug:slug>/', views.CourseDetailView.as_view(), name='course_detail'),
+     path('<slug:slug>/',
+          async_views.course_detail if settings.ASYNC_VIEWS else views.CourseDetailView.as_view(),
+          name='course_detail'),
 ]
\ No newline at end of file
@@ -0,0 +1,43 @@
+import logging
+import requests
+from django.conf import settings
+from django.utils.module_loading import import_string
+from embed_video.backends import EmbedVideoException, detect_backend
+
+logger = logging.getLogger(__name__)
+
+
+# resolves a video URL with the backends of django-embed-video: the provider, the URL of its
+# player, a thumbnail and the dimensions of the video when the provider tells them
+def resolve_embed_video(url):
+    backend = detect_backend(url)
+    backend.is_secure = True
+    if not backend.code:
+        raise EmbedVideoException(f'No video id in {url}')
+    try:
+        # Vimeo and SoundCloud describe the video with a remote call, YouTube doesn't
+        info = backend.info or {}
+    except NotImplementedError:
+        info = {}
+    size = [info.get('width'), info.get('height')]
+    return {
+        'provider': backend.backend.replace('Backend', '').lower(),
+        'embed_url': str(backend.url),
+        'thumbnail_url': backend.thumbnail,
+        # SoundCloud sends a width of "100%"
+        'width': size[0] if all(isinstance(value, int) for value in size) else None,
+        'height': size[1] if all(isinstance(value, int) for value in size) else None,
+    }
+
+
+# embed metadata of a video URL from the resolver of settings.VIDEO_EMBED_RESOLVER, e.g. a stub
+# returning fixed metadata in tests. Videos that cannot be resolved get no embed_url and are
+# rendered as a link, until resolve_video_embeds is run again
+def get_embed(url):
+    try:
+        embed = import_string(settings.VIDEO_EMBED_RESOLVER)(url)
+    except (EmbedVideoException, requests.RequestException, ValueError) as e:
+        logger.warning('Could not resolve the video %s: %r', url, e)
+        embed = {}
+    embed['source'] = url
+    return embed
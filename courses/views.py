@@ -1,3 +1,10 @@
+import binascii
+import hashlib
+import mimetypes
+import os
+import re
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
 from django.urls import reverse_lazy
 from django.shortcuts import redirect, get_object_or_404
 from django.views.generic.base import TemplateResponseMixin, View
@@ -5,13 +12,30 @@ from django.views.generic.list import ListView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic.detail import DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
+from django.contrib.auth.models import User
 from django.forms.models import modelform_factory
 from django.apps import apps
-from django.db.models import Count
-from django.core.cache import cache
-from braces.views import CsrfExemptMixin, JsonRequestResponseMixin
-from .models import Course, Module, Content, Subject
-from .forms import ModuleFormSet
+from django.db import transaction
+from django.db.backends.base.operations import BaseDatabaseOperations
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
+from educa.routers import replica_reads
+from django.core.files import File
+from braces.views import CsrfExemptMixin, JsonRequestResponseMixin, JSONResponseMixin
+from .models import Course, Module, Content, Subject, Upload
+from .storage import HashedTemporaryFile, file_sha256, upload_hashes
+from .media import can_access_media, parse_range
+from .forms import ModuleFormSet, CourseCloneForm
+from .transfer import clone_course
+from .caching import CATALOG_VERSION_KEY, course_version_key, module_version_key, get_version, bump_version, get_or_build
 from students.forms import CourseEnrollForm
 
 
@@ -62,6 +86,27 @@ class CourseDeleteView(OwnerCourseMixin, DeleteView):
     template_name = 'courses/manage/course/delete.html'
     permission_required = 'courses.delete_course'
 
+# copies a course of the current user with all its modules and contents, so it can be run again
+# without rebuilding it by hand. The copy starts without students
+class CourseCloneView(LoginRequiredMixin, PermissionRequiredMixin, TemplateResponseMixin, View):
+    template_name = 'courses/manage/course/clone.html'
+    permission_required = 'courses.add_course'
+
+    def get_form(self, course, data=None):
+        return CourseCloneForm(data=data, initial={'title': f'{course.title} (copy)', 'slug': f'{course.slug}-copy'})
+
+    def get(self, request, pk):
+        course = get_object_or_404(Course, id=pk, owner=request.user)
+        return self.render_to_response({'course': course, 'form': self.get_form(course)})
+
+    def post(self, request, pk):
+        course = get_object_or_404(Course, id=pk, owner=request.user)
+        form = self.get_form(course, data=request.POST)
+        if form.is_valid():
+            clone = clone_course(course, request.user, form.cleaned_data['title'], form.cleaned_data['slug'])
+            return redirect('course_module_update', clone.id)
+        return self.render_to_response({'course': course, 'form': form})
+
 # This handles the formset to add, update and delete modules for a specific course
 # TemplateResponseMixin renders templates and returns an HTTP response
 class CourseModuleUpdateView(TemplateResponseMixin, View):
@@ -155,62 +200,347 @@ class ModuleContentListView(TemplateResponseMixin, View):
 
     def get(self, request, module_id):
         module = get_object_or_404(Module, id=module_id, course__owner=request.user)
-        return self.render_to_response({'module': module})
+        # contents with their items batched by content type, evaluated by the template
+        contents = module.contents.with_items()
+        return self.render_to_response({'module': module, 'contents': contents})
+
+
+# applies the {id: order} payload sent by the drag-and-drop sidebar in a single transaction
+class OrderMixin(CsrfExemptMixin, JsonRequestResponseMixin):
+    # the model of the reordered objects
+    model = None
+    # lookup from the reordered objects to the owner of their course
+    owner_lookup = None
+    # to the course they belong to
+    course_lookup = None
+    # and to the module whose contents they are, for contents
+    module_lookup = None
 
+    # only the objects of the current user can be reordered
+    def get_queryset(self):
+        return self.model.objects.filter(**{self.owner_lookup: self.request.user})
 
-class ModuleOrderView(CsrfExemptMixin, JsonRequestResponseMixin, View):
     def post(self, request):
-        for id, order in self.request_json.items():
-            Module.objects.filter(id=id, course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        qs = self.get_queryset()
+        try:
+            updated = qs.reorder(self.request_json)
+        except ValueError as e:
+            # malformed payloads and ids the user does not own are rejected as a whole
+            return self.render_bad_request_response({'errors': [str(e)]})
+        if updated:
+            # update() sends no signals, invalidate the cached course contents here
+            reordered = qs.filter(pk__in=self.request_json)
+            for course_id in reordered.values_list(self.course_lookup, flat=True).distinct():
+                bump_version(course_version_key(course_id))
+            if self.module_lookup:
+                for module_id in reordered.values_list(self.module_lookup, flat=True).distinct():
+                    bump_version(module_version_key(module_id))
+        return self.render_json_response({'saved': 'OK', 'updated': updated})
+
+
+class ModuleOrderView(OrderMixin, View):
+    model = Module
+    owner_lookup = 'course__owner'
+    course_lookup = 'course_id'
+
+
+class ContentOrderView(OrderMixin, View):
+    model = Content
+    owner_lookup = 'module__course__owner'
+    course_lookup = 'module__course_id'
+    module_lookup = 'module_id'
 
 
-class ContentOrderView(CsrfExemptMixin, JsonRequestResponseMixin, View):
+# starts a chunked upload, the client then PUTs the file in chunks and can resume
+# an interrupted upload from the offset returned by GET
+class UploadCreateView(CsrfExemptMixin, LoginRequiredMixin, PermissionRequiredMixin, JsonRequestResponseMixin, View):
+    # uploads become contents, only the users who may add contents can start them
+    permission_required = 'courses.add_content'
+
     def post(self, request):
-        for id, order in self.request_json.items():
-            Content.objects.filter(id=id, module__course__owner=request.user).update(order=order)
-        return self.render_json_response({'saved': 'OK'})
+        data = self.request_json or {}
+        filename = os.path.basename(str(data.get('filename', '')))[:255]
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            size = -1
+        if not filename or size < 0:
+            return self.render_bad_request_response({'errors': ['Send the filename and size of the file.']})
+        if size > settings.UPLOAD_MAX_SIZE:
+            return self.render_json_response({'errors': ['File too large.']}, status=413)
+        with transaction.atomic():
+            # the space reserved by the unfinished uploads of the user, counted with the user row
+            # locked so concurrent requests cannot both take the last of the quota
+            User.objects.select_for_update().get(pk=request.user.pk)
+            reserved = Upload.objects.filter(owner=request.user).aggregate(total=Sum('size'))['total'] or 0
+            if reserved + size > settings.UPLOAD_USER_QUOTA:
+                return self.render_json_response({'errors': ['Upload quota exceeded, finish or wait for '
+                                                             'the expiry of your other uploads.']}, status=413)
+            upload = Upload.objects.create(owner=request.user, filename=filename, size=size)
+        os.makedirs(settings.UPLOAD_CHUNK_DIR, exist_ok=True)
+        open(upload.path, 'wb').close()
+        return self.render_json_response({'id': str(upload.id), 'offset': 0, 'size': size}, status=201)
+
+
+class UploadChunkView(CsrfExemptMixin, LoginRequiredMixin, PermissionRequiredMixin, JSONResponseMixin, View):
+    permission_required = 'courses.add_content'
+    upload = None
+
+    def dispatch(self, request, upload_id):
+        if request.user.is_authenticated:
+            self.upload = get_object_or_404(Upload, id=upload_id, owner=request.user)
+        return super().dispatch(request, upload_id)
 
+    def render_upload_response(self, status=200):
+        upload = self.upload
+        return self.render_json_response({'id': str(upload.id), 'offset': upload.received,
+                                          'size': upload.size, 'complete': upload.complete}, status=status)
 
+    # the offset to resume an interrupted upload from
+    def get(self, request, upload_id):
+        return self.render_upload_response()
+
+    # appends the request body at the offset given by "Content-Range: bytes <start>-<end>/<size>",
+    # streaming it to disk and hashing it on the way. An optional X-Chunk-SHA256 header is verified
+    def put(self, request, upload_id):
+        upload = self.upload
+        match = re.match(r'^bytes (\d+)-(\d+)/(\d+|\*)$', request.META.get('HTTP_CONTENT_RANGE', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if not match or int(match.group(2)) - int(match.group(1)) + 1 != length:
+            return self.render_json_response({'errors': ['Send a Content-Range header matching the body.']},
+                                             status=400)
+        offset = int(match.group(1))
+        if offset != upload.received:
+            # the client is out of sync, tell it where to resume from
+            return self.render_upload_response(status=409)
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE or offset + length > upload.size:
+            return self.render_json_response({'errors': ['Chunk too large.']}, status=413)
+        sha = hashlib.sha256()
+        # the hash of the whole upload, carried on when this process received the previous chunks
+        upload_sha = upload_hashes.get(upload.pk, offset)
+        with open(upload.path, 'r+b') as f:
+            # drop the bytes of a previously interrupted chunk
+            f.seek(offset)
+            f.truncate()
+            remaining = length
+            while remaining:
+                data = request.read(min(64 * 1024, remaining))
+                if not data:
+                    break
+                f.write(data)
+                sha.update(data)
+                if upload_sha is not None:
+                    upload_sha.update(data)
+                remaining -= len(data)
+            expected = request.META.get('HTTP_X_CHUNK_SHA256')
+            if remaining or (expected and expected.lower() != sha.hexdigest()):
+                f.truncate(offset)
+                return self.render_json_response({'errors': ['Chunk incomplete or corrupted.']}, status=400)
+        # a concurrent request for the same offset may have won the race. update() skips auto_now,
+        # the updated time is what keeps the upload from being removed by clean_uploads
+        if not Upload.objects.filter(pk=upload.pk, received=offset).update(received=offset + length,
+                                                                           updated=timezone.now()):
+            upload.refresh_from_db()
+            return self.render_upload_response(status=409)
+        upload.received = offset + length
+        upload_hashes.set(upload.pk, upload.received, upload_sha)
+        return self.render_upload_response()
+
+
+# turns a complete upload into a File or Image content of a module
+class UploadCompleteView(CsrfExemptMixin, LoginRequiredMixin, PermissionRequiredMixin, JsonRequestResponseMixin, View):
+    permission_required = 'courses.add_content'
+
+    # the upload row stays locked until the content is created, so a repeated request
+    # waits and then finds the upload gone instead of creating the content twice
+    @method_decorator(transaction.atomic)
+    def post(self, request, upload_id):
+        upload = get_object_or_404(Upload.objects.select_for_update(), id=upload_id, owner=request.user)
+        if not upload.complete:
+            return self.render_json_response({'errors': ['The upload is not complete.'],
+                                              'offset': upload.received}, status=409)
+        data = self.request_json or {}
+        model_name = data.get('model_name')
+        if model_name not in ['file', 'image']:
+            return self.render_bad_request_response({'errors': ['model_name must be file or image.']})
+        module = get_object_or_404(Module, id=data.get('module_id'), course__owner=request.user)
+        model = apps.get_model(app_label='courses', model_name=model_name)
+        # the file is moved into the content storage under its hash, or dropped if an identical
+        # file is already stored. It was hashed while its chunks were received, unless some were
+        # received by another process, it is then hashed in one sequential read
+        sha256 = upload_hashes.pop(upload.pk, upload.size)
+        if sha256 is None:
+            with open(upload.path, 'rb') as f:
+                sha256 = file_sha256(File(f))
+        obj = model(owner=request.user, title=str(data.get('title') or upload.filename)[:250])
+        with HashedTemporaryFile(upload.path, upload.filename, sha256) as content:
+            obj.file.save(upload.filename, content, save=False)
+        obj.save()
+        Content.objects.create(module=module, item=obj)
+        path = upload.path
+        upload.delete()
+
+        # the file has been moved into the storage unless an identical one was already there
+        def remove_part():
+            if os.path.exists(path):
+                os.remove(path)
+
+        transaction.on_commit(remove_part)
+        return self.render_json_response({'id': obj.id, 'file': obj.file.name, 'sha256': sha256}, status=201)
+
+
+# serves media files to the users allowed to see them. Range and conditional requests are
+# supported, and with MEDIA_SENDFILE_BACKEND set the front-end server transfers the bytes
+class MediaView(View):
+    def get(self, request, path):
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(full_path) or not can_access_media(request.user, path):
+            raise Http404
+        stat = os.stat(full_path)
+        etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+        # answers If-None-Match and If-Modified-Since with 304, If-Match with 412
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = self.get_file_response(request, path, full_path, stat.st_size, etag)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Accept-Ranges'] = 'bytes'
+        # enrolled-only files must not be stored by shared caches, including the site-wide one
+        patch_cache_control(response, private=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+        return response
+
+    def get_file_response(self, request, path, full_path, size, etag):
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        backend = settings.MEDIA_SENDFILE_BACKEND
+        if backend:
+            # the front-end server sends the file and handles Range itself
+            response = HttpResponse(content_type=content_type)
+            if backend == 'x-accel-redirect':
+                response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+            else:
+                response['X-Sendfile'] = full_path
+            return response
+        byte_range = None
+        # If-Range only allows a partial response for the current version of the file
+        if 'HTTP_RANGE' in request.META and request.META.get('HTTP_IF_RANGE', etag) == etag:
+            try:
+                byte_range = parse_range(request.META['HTTP_RANGE'], size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{size}'
+                return response
+        if byte_range is None:
+            return FileResponse(open(full_path, 'rb'), content_type=content_type)
+        start, end = byte_range
+        response = StreamingHttpResponse(read_range(full_path, start, end - start + 1),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+        return response
+
+
+def read_range(full_path, start, length, chunk_size=64 * 1024):
+    with open(full_path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+# the public catalog is cached as evaluated rows under the catalog version,
+# so the page itself is not stored by the site-wide cache middleware
+@method_decorator(never_cache, name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
 class CourseListView(TemplateResponseMixin, View):
     model = Course
     template_name = 'courses/course/list.html'
+    # largest value of the id column
+    max_id = BaseDatabaseOperations.integer_field_ranges[Course._meta.pk.get_internal_type()][1]
+
+    def get_subjects(self):
+        # all available subjects and their denormalized number of courses
+        return list(Subject.objects.values('id', 'title', 'slug', 'total_courses'))
+
+    # the cursor points at the last course of the previous page, as "<created>|<id>"
+    def encode_cursor(self, course):
+        value = f"{course['created'].isoformat()}|{course['id']}"
+        return urlsafe_b64encode(value.encode()).decode()
+
+    # returns the aware creation time, in UTC, and the id of the course a cursor points at
+    def decode_cursor(self, cursor):
+        try:
+            created, id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            created, id = datetime.fromisoformat(created), int(id)
+            # ids out of the range of the column would make the query fail
+            if created.tzinfo is None or not 0 < id <= self.max_id:
+                raise ValueError
+            return created.astimezone(timezone.utc), id
+        except (ValueError, OverflowError, binascii.Error):
+            raise Http404('Invalid page cursor.')
+
+    def get_courses(self, subject=None, position=None):
+        # retrieve a page of courses, including the denormalized number of modules of
+        # each course and the subject and owner fields the template displays in the same query
+        courses = Course.objects.order_by('-created', '-id')
+        if subject:
+            # limit the query to the courses that belong to the given subject
+            courses = courses.filter(subject_id=subject['id'])
+        if position:
+            # keyset pagination: continue right after the last course of the previous page,
+            # so any page is read from the (created, id) index like the first one
+            created, id = position
+            courses = courses.filter(Q(created__lt=created) | Q(created=created, id__lt=id))
+        # fetch one extra row to know whether there is a next page
+        courses = list(courses.values('id', 'title', 'slug', 'created', 'total_modules',
+                                      'subject__title', 'subject__slug',
+                                      'owner__first_name', 'owner__last_name')
+                       [:settings.CATALOG_PAGE_SIZE + 1])
+        for course in courses:
+            # same as User.get_full_name()
+            course['owner_name'] = f"{course['owner__first_name']} {course['owner__last_name']}".strip()
+        next_cursor = None
+        if len(courses) > settings.CATALOG_PAGE_SIZE:
+            courses = courses[:settings.CATALOG_PAGE_SIZE]
+            next_cursor = self.encode_cursor(courses[-1])
+        return {'courses': courses, 'next_cursor': next_cursor}
 
     def get(self, request, subject=None):
-        # try to get all students
-        subjects = cache.get('all_subjects')
-        # if no students found ..
-        if not subjects:
-            # then retrieve all available courses for each subject and number of courses
-            subjects = Subject.objects.annotate(total_courses=Count('courses'))
-            cache.set('all_subjects', subjects)
-        # retrieve all available courses for each subject, 
-        # including the total number of modules contained in each course
-        all_courses = Course.objects.annotate(total_modules=Count('modules'))
-        
+        version = get_version(CATALOG_VERSION_KEY)
+        subjects = get_or_build('all_subjects', version, self.get_subjects)
+        cursor = request.GET.get('cursor')
         if subject:
-            # retrieve corresponding subject object and limit 
-            # the query to the courses that belong to the given subject
-            subject = get_object_or_404(Subject, slug=subject)
+            # retrieve corresponding subject from the cached subjects
+            subject = next((s for s in subjects if s['slug'] == subject), None)
+            if subject is None:
+                raise Http404('No subject matches the given query.')
             # if there is subject, build the key dynamically
-            key = f'subject_{subject.id}_courses'
-            courses = cache.get(key)
-            if not courses:
-                courses = all_courses.filter(subject=subject)
-                cache.set(key, courses)
+            key = f'subject_{subject["id"]}_courses'
         else:
-            courses = cache.get('all_courses')
-            if not courses:
-                courses = all_courses
-                cache.set('all_courses', courses)
+            key = 'all_courses'
+        position = None
+        if cursor:
+            # the key is built from the decoded position, not from what the client sent,
+            # so a position has a single, bounded key however it is encoded
+            position = self.decode_cursor(cursor)
+            key = f'{key}_{position[0].isoformat()}_{position[1]}'
+        page = get_or_build(key, version, lambda: self.get_courses(subject, position))
         # render the objects to a template and return an HTTP response
         return self.render_to_response({
             'subjects': subjects,
             'subject': subject,
-            'courses': courses
+            'courses': page['courses'],
+            'cursor': cursor,
+            'next_cursor': page['next_cursor'],
         })
 
 
+@method_decorator(replica_reads, name='dispatch')
 class CourseDetailView(DetailView):
     model = Course
     template_name = 'courses/course/detail.html'
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'educa.settings')
+# serve the read-heavy endpoints with their async views
+os.environ.setdefault('EDUCA_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
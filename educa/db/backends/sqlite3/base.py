@@ -0,0 +1,25 @@
+from django.db.backends.sqlite3 import base
+
+
+# the stock SQLite backend, configured on every new connection with the pragmas given in
+# OPTIONS['pragmas'], e.g. {'journal_mode': 'wal', 'busy_timeout': 5000}.
+# OPTIONS['transaction_mode'] = 'IMMEDIATE' makes atomic blocks take the write lock when they
+# start: a deferred transaction that reads and then writes fails with "database is locked"
+# right away if another connection wrote in the meantime, busy_timeout cannot help it
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        # not arguments of sqlite3.connect()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        self.cursor().execute(f'BEGIN {mode}' if mode else 'BEGIN')
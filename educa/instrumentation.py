@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.core.cache.backends import locmem, memcached
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends import django as django_backend
+
+logger = logging.getLogger('educa.metrics')
+
+# metrics of the request being handled. The context variable is copied into the threads
+# sync_to_async() runs code in, so queries of async views are counted too
+_metrics = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.query_ms = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.render_ms = 0.0
+        self.rendering = False
+
+
+@contextmanager
+def collect_metrics():
+    # connections opened before this module was imported missed the connection_created signal
+    for connection in connections.all():
+        install_query_recorder(None, connection)
+    metrics = RequestMetrics()
+    token = _metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _metrics.reset(token)
+
+
+# database execute wrapper, times every query made while metrics are collected
+def record_query(execute, sql, params, many, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.query_ms += (time.perf_counter() - start) * 1000
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # the signal is sent again when a closed connection is reopened
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder, dispatch_uid='install_query_recorder')
+
+
+_missing = object()
+
+
+# counts the hits and misses of get() and get_many(), see the backends below
+class InstrumentedCacheMixin:
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _missing, version)
+        self.record(hits=int(value is not _missing), misses=int(value is _missing))
+        return default if value is _missing else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version)
+        self.record(hits=len(values), misses=len(keys) - len(values))
+        return values
+
+    def record(self, hits, misses):
+        metrics = _metrics.get()
+        if metrics is not None:
+            metrics.cache_hits += hits
+            metrics.cache_misses += misses
+
+
+class MemcachedCache(InstrumentedCacheMixin, memcached.MemcachedCache):
+    pass
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
+
+
+# times the rendering of templates. Templates rendered while another one is being rendered
+# (e.g. content items) are part of its time
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        metrics = _metrics.get()
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.rendering = False
+            metrics.render_ms += (time.perf_counter() - start) * 1000
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
+
+
+# maximum number of queries a function view should make, e.g. @query_budget(6).
+# Class-based views declare a query_budget attribute, viewset actions a query_budget argument
+# and the list() and retrieve() methods of viewsets are decorated like function views
+def query_budget(budget):
+    def decorator(view_func):
+        view_func.query_budget = budget
+        return view_func
+    return decorator
+
+
+def get_query_budget(view_func):
+    # REST framework actions, e.g. @action(detail=True, query_budget=6)
+    budget = getattr(view_func, 'initkwargs', {}).get('query_budget')
+    view_class = getattr(view_func, 'view_class', getattr(view_func, 'cls', None))
+    if budget is None:
+        # the viewset methods a route maps its HTTP methods to, e.g. {'get': 'list'}
+        budgets = [getattr(getattr(view_class, name, None), 'query_budget', None)
+                   for name in getattr(view_func, 'actions', {}).values()]
+        budget = max((budget for budget in budgets if budget is not None), default=None)
+    if budget is None:
+        budget = getattr(view_class, 'query_budget', None)
+    if budget is None:
+        budget = getattr(view_func, 'query_budget', None)
+    return budget
+
+
+# totals of every URL pattern since this process started
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def record_request(route, metrics, total_ms, over_budget):
+    with _stats_lock:
+        stats = _stats.setdefault(route, {
+            'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0, 'query_ms': 0.0,
+            'cache_hits': 0, 'cache_misses': 0, 'render_ms': 0.0, 'over_budget': 0,
+        })
+        stats['requests'] += 1
+        stats['total_ms'] += total_ms
+        stats['max_ms'] = max(stats['max_ms'], total_ms)
+        stats['queries'] += metrics.queries
+        stats['query_ms'] += metrics.query_ms
+        stats['cache_hits'] += metrics.cache_hits
+        stats['cache_misses'] += metrics.cache_misses
+        stats['render_ms'] += metrics.render_ms
+        stats['over_budget'] += over_budget
+
+
+# averages per request of every URL pattern
+def get_stats():
+    with _stats_lock:
+        return {route: {
+            'requests': stats['requests'],
+            'avg_ms': round(stats['total_ms'] / stats['requests'], 2),
+            'max_ms': round(stats['max_ms'], 2),
+            'avg_queries': round(stats['queries'] / stats['requests'], 2),
+            'avg_query_ms': round(stats['query_ms'] / stats['requests'], 2),
+            'cache_hit_ratio': round(stats['cache_hits'] / (stats['cache_hits'] + stats['cache_misses']), 3)
+            if stats['cache_hits'] + stats['cache_misses'] else None,
+            'avg_render_ms': round(stats['render_ms'] / stats['requests'], 2),
+            'over_budget': stats['over_budget'],
+        } for route, stats in sorted(_stats.items())}
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import logging
+import time
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from .instrumentation import collect_metrics, get_query_budget, record_request, logger
+
+
+# runs a middleware in the mode of the handler, sync under WSGI and async under ASGI,
+# so it is not adapted with async_to_sync() and sync_to_async() around it. See MiddlewareMixin
+class AsyncCapableMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # the handler awaits __call__
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+# pins a client to the primary database for a short time after any write request,
+# so they read their own changes even if the replicas are lagging behind
+class ReplicaPinMiddleware(AsyncCapableMiddleware):
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(settings.REPLICA_PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+# records the queries, cache hits and misses and template render time of every request.
+# They are totalled per URL pattern (see the metrics view), logged to the educa.metrics logger
+# and, with settings.INSTRUMENTATION_HEADERS, sent in the Server-Timing and X-Query-Count headers.
+# Goes first, so pages served by the cache middleware are measured too
+class InstrumentationMiddleware(AsyncCapableMiddleware):
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with collect_metrics() as metrics:
+            response = self.get_response(request)
+        return self.record(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with collect_metrics() as metrics:
+            response = await self.get_response(request)
+        return self.record(request, response, metrics, start)
+
+    def record(self, request, response, metrics, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        match = request.resolver_match
+        if match is None:
+            # not resolved when the cache middleware answered
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                pass
+        route = match.route if match else '<unresolved>'
+        budget = get_query_budget(match.func) if match else None
+        over_budget = budget is not None and metrics.queries > budget
+        record_request(route, metrics, total_ms, over_budget)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'route': route, 'method': request.method, 'status': response.status_code,
+                'ms': round(total_ms, 2), 'queries': metrics.queries, 'query_ms': round(metrics.query_ms, 2),
+                'cache_hits': metrics.cache_hits, 'cache_misses': metrics.cache_misses,
+                'render_ms': round(metrics.render_ms, 2),
+            }))
+        if over_budget:
+            logger.warning('%s made %d queries, its budget is %d', route, metrics.queries, budget)
+        if settings.INSTRUMENTATION_HEADERS:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.query_ms:.2f};desc="{metrics.queries} queries"',
+                f'cache;desc="{metrics.cache_hits} hits, {metrics.cache_misses} misses"',
+                f'render;dur={metrics.render_ms:.2f}',
+                f'total;dur={total_ms:.2f}',
+            ])
+            response['X-Query-Count'] = str(metrics.queries)
+            if budget is not None:
+                response['X-Query-Budget'] = str(budget)
+        return response
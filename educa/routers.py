@@ -0,0 +1,74 @@
+import random
+from asyncio import iscoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# set while a view marked with replica_reads handles a request. A context variable is
+# copied into the threads sync_to_async() runs code in, so async views are covered too
+_use_replica = ContextVar('use_replica', default=False)
+
+# sessions are written and read back in consecutive requests, they always stay on the primary
+PRIMARY_APP_LABELS = {'sessions'}
+
+
+# sends reads to a random replica while a replica_reads view runs, everything else to the primary
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (_use_replica.get() and settings.DATABASE_REPLICAS
+                and model._meta.app_label not in PRIMARY_APP_LABELS
+                # reads inside a transaction must see its own writes
+                and not connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    # replicas hold the same rows as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # replicas get their schema from the primary
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+# reads from the primary within the block, used when building values that are cached
+# until invalidated, so a lagging replica never stores outdated rows under a new version
+@contextmanager
+def primary():
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+# safe requests are read from a replica unless the user wrote something in the last
+# few seconds, see ReplicaPinMiddleware
+def use_replica(request):
+    return request.method in ('GET', 'HEAD', 'OPTIONS') and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+
+
+# marks a view (or a class-based view's dispatch, with method_decorator) as replica-safe.
+# Template responses are rendered after the view returns, so queries made by templates
+# (e.g. cached fragments) still read from the primary
+def replica_reads(view_func):
+    if iscoroutinefunction(view_func):
+        async def wrapped_view(request, *args, **kwargs):
+            token = _use_replica.set(use_replica(request))
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+    else:
+        def wrapped_view(request, *args, **kwargs):
+            token = _use_replica.set(use_replica(request))
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+    return wraps(view_func)(wrapped_view)
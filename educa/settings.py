@@ -48,8 +48,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'educa.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'educa.middleware.ReplicaPinMiddleware',
     'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.cache.FetchFromCacheMiddleware',
@@ -63,7 +65,8 @@ ROOT_URLCONF = 'educa.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # times template rendering, see educa.instrumentation
+        'BACKEND': 'educa.instrumentation.DjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -79,17 +82,66 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'educa.wsgi.application'
 
+# send the queries, cache hits and misses and render time of each request in response headers
+INSTRUMENTATION_HEADERS = DEBUG
+
+# route the read-heavy endpoints to their async versions, educa.asgi turns it on by default
+ASYNC_VIEWS = os.environ.get('EDUCA_ASYNC_VIEWS', '0') == '1'
+# run the synchronous code of the async views on the one thread shared with the rest of the
+# synchronous code instead of in a pool, see courses.async_views. Tests using TestCase need it,
+# their transaction is not visible to the connections of other threads, e.g.
+# EDUCA_ASYNC_VIEWS=1 EDUCA_ASYNC_VIEWS_THREAD_SENSITIVE=1 python manage.py test
+ASYNC_VIEWS_THREAD_SENSITIVE = os.environ.get('EDUCA_ASYNC_VIEWS_THREAD_SENSITIVE', '0') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# SQLite tuned for concurrent requests, see educa.db.backends.sqlite3
+SQLITE_OPTIONS = {
+    'pragmas': {
+        # readers don't block the writer and the writer doesn't block readers
+        'journal_mode': 'wal',
+        # in WAL mode, only the checkpoints wait for the disk
+        'synchronous': 'normal',
+        'mmap_size': 256 * 1024 * 1024,  # 256 MB
+        'cache_size': -64 * 1024,  # 64 MB, negative sizes are in KB
+        # wait up to 5 seconds for the write lock instead of failing
+        'busy_timeout': 5000,
+    },
+    'transaction_mode': 'IMMEDIATE',
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'educa.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'OPTIONS': SQLITE_OPTIONS,
+        # reuse connections between requests, set EDUCA_CONN_MAX_AGE=0 to close them after each one
+        'CONN_MAX_AGE': int(os.environ.get('EDUCA_CONN_MAX_AGE', 60)),
     }
 }
 
+# aliases of the read replicas of the default database. Set EDUCA_DB_REPLICA to the name of
+# a second SQLite file to try them locally, and copy the primary into it with ./manage.py sync_replica
+DATABASE_REPLICAS = []
+if os.environ.get('EDUCA_DB_REPLICA'):
+    DATABASES['replica'] = {
+        'ENGINE': 'educa.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, os.environ['EDUCA_DB_REPLICA']),
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        # tests read the replica through the test database of the primary
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+
+# catalog, course and API reads go to the replicas, see educa.routers
+DATABASE_ROUTERS = ['educa.routers.ReplicaRouter']
+# after a write, a client reads from the primary for this long, so it sees its own changes
+REPLICA_PIN_SECONDS = 15
+REPLICA_PIN_COOKIE = 'primary_pin'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -136,10 +188,18 @@ LOGIN_REDIRECT_URL = reverse_lazy('student_course_list')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+# None to stream media files from Django, 'x-sendfile' (Apache, lighttpd) or
+# 'x-accel-redirect' (nginx) to let the front-end server send them after the access check
+MEDIA_SENDFILE_BACKEND = None
+# internal nginx location aliased to MEDIA_ROOT, used with 'x-accel-redirect'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+# browsers may keep media files for this long without revalidating them
+MEDIA_CACHE_MAX_AGE = 60 * 60
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        # counts cache hits and misses, see educa.instrumentation
+        'BACKEND': 'educa.instrumentation.MemcachedCache',
         'LOCATION': '127.0.0.1:11211',
     }
 }
@@ -147,6 +207,55 @@ CACHES = {
 CACHE_MIDDLEWARE_ALIAS = 'default'
 CACHE_MIDDLEWARE_SECONDS = 60 * 15  # 15 minutes
 CACHE_MIDDLEWARE_KEY_PREFIX = 'educa'
+# rendered content items are keyed by their update time, so they can be kept for long
+ITEM_RENDER_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # 1 week
+# part of the keys of rendered content items, change it when the courses/content templates
+# change so that items are rendered again with them
+ITEM_RENDER_CACHE_VERSION = os.environ.get('EDUCA_ITEM_RENDER_CACHE_VERSION', '1')
+# catalog rows are rebuilt after this time or as soon as the catalog version changes
+CATALOG_CACHE_TIMEOUT = 60 * 15  # 15 minutes
+# stale catalog rows are kept this long to be served while a single process rebuilds them
+CATALOG_CACHE_STALE_TIMEOUT = 60 * 60 * 24  # 1 day
+CATALOG_CACHE_LOCK_TIMEOUT = 30
+# serialized course contents are cached per course version
+COURSE_CONTENTS_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
+# template fragments shared by the students of a course, keyed by the course and module versions
+# that every change bumps, so they can be kept for long
+COURSE_FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # 1 week
+# enrolled course ids of each user, invalidated when enrollments change
+ENROLLMENT_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
+# number of courses on each page of the catalog
+CATALOG_PAGE_SIZE = 20
+
+# rows written to the students through table by each bulk enrollment batch
+BULK_ENROLL_CHUNK_SIZE = 1000
+
+# widths of the resized copies generated for every uploaded image
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_VARIANT_QUALITY = 80
+# processes of the pool that generates them
+IMAGE_VARIANT_WORKERS = 2
+
+# resolves the embed metadata of videos when they are saved, see courses.video
+VIDEO_EMBED_RESOLVER = 'courses.video.resolve_embed_video'
+# the YouTube thumbnail of every video, instead of probing the available resolutions with HEAD requests
+EMBED_VIDEO_YOUTUBE_CHECK_THUMBNAIL = False
+# seconds to wait for the providers that are asked for the metadata
+EMBED_VIDEO_TIMEOUT = 5
+
+# partial chunked uploads are assembled here before they are moved to MEDIA_ROOT,
+# keep it on the same filesystem so that the move is a rename
+UPLOAD_CHUNK_DIR = os.path.join(MEDIA_ROOT, 'uploads')
+# largest chunk accepted by a single request
+UPLOAD_CHUNK_MAX_SIZE = 8 * 1024 * 1024  # 8 MB
+# largest file that can be uploaded, and total size of the unfinished uploads of a user
+UPLOAD_MAX_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB
+UPLOAD_USER_QUOTA = 5 * 1024 * 1024 * 1024  # 5 GB
+# unfinished uploads without a chunk for this long are removed by clean_uploads
+UPLOAD_EXPIRY = 60 * 60 * 24  # 1 day
+
+# search index backend, the SQLite one stores an FTS5 table in the default database
+SEARCH_BACKEND = 'courses.search.SQLiteFTSBackend'
 
 REST_FRAMEWORK = {
     # This provides basic CRUD objects
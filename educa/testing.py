@@ -0,0 +1,20 @@
+from urllib.parse import urlsplit
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from .instrumentation import get_query_budget
+
+
+# TestCase mixin, fails when a view makes more queries than its declared query budget, e.g.
+# self.assertWithinQueryBudget(self.client.get, reverse('student_course_detail', args=[course.id]))
+class QueryBudgetMixin:
+    def assertWithinQueryBudget(self, request, path, *args, **kwargs):
+        budget = get_query_budget(resolve(urlsplit(path).path).func)
+        if budget is None:
+            self.fail(f'The view of {path} declares no query budget.')
+        with CaptureQueriesContext(connection) as context:
+            response = request(path, *args, **kwargs)
+        if len(context) > budget:
+            queries = '\n'.join(query['sql'] for query in context.captured_queries)
+            self.fail(f'{path} made {len(context)} queries, its budget is {budget}:\n{queries}')
+        return response
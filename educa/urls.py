@@ -17,18 +17,20 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
 from django.conf import settings
-from django.conf.urls.static import static
-from courses.views import CourseListView
+from courses.views import CourseListView, MediaView
+from courses import async_views
+from . import views
 
 urlpatterns = [
     path('accounts/login/', auth_views.LoginView.as_view(), name='login'),
     path('accounts/logout/', auth_views.LogoutView.as_view(), name='logout'),
     path('admin/', admin.site.urls),
+    # request metrics of this process, for staff
+    path('metrics/', views.metrics, name='metrics'),
     path('course/', include('courses.urls')),
-    path('', CourseListView.as_view(), name='course_list'),
+    path('', async_views.course_list if settings.ASYNC_VIEWS else CourseListView.as_view(), name='course_list'),
     path('students/', include('students.urls')),
     path('api/', include('courses.api.urls', namespace='api')),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    # media files are only served to their owners and enrolled students
+    path(f'{settings.MEDIA_URL.lstrip("/")}<path:path>', MediaView.as_view(), name='media'),
+]
\ No newline at end of file
@@ -0,0 +1,12 @@
+import os
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+from django.views.decorators.cache import never_cache
+from .instrumentation import get_stats
+
+
+# per-request averages of every URL pattern served by this process, see InstrumentationMiddleware
+@never_cache
+@staff_member_required
+def metrics(request):
+    return JsonResponse({'pid': os.getpid(), 'routes': get_stats()})
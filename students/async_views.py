@@ -0,0 +1,12 @@
+from educa.instrumentation import query_budget
+from educa.routers import replica_reads
+from courses.async_views import run_view
+from .views import StudentCourseDetailView
+
+
+# async version of StudentCourseDetailView, see courses.async_views
+@replica_reads
+@query_budget(StudentCourseDetailView.query_budget)
+async def student_course_detail(request, pk, module_id=None):
+    kwargs = {'pk': pk} if module_id is None else {'pk': pk, 'module_id': module_id}
+    return await run_view(StudentCourseDetailView, request, **kwargs)
@@ -1,3 +1,90 @@
-from django.test import TestCase
+from unittest import mock
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from courses.models import Module, Content, Text
+from courses.tests import CourseTestCase
+from educa.testing import QueryBudgetMixin
 
-# Create your tests here.
+
+class StudentCourseDetailQueryBudgetTest(QueryBudgetMixin, CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.student)
+
+    def test_course_detail(self):
+        response = self.assertWithinQueryBudget(self.client.get, reverse('student_course_detail', args=[self.course.id]))
+        self.assertContains(response, 'Introduction')
+
+    def test_module_detail(self):
+        response = self.assertWithinQueryBudget(
+            self.client.get, reverse('student_course_detail_module', args=[self.course.id, self.module.id]))
+        self.assertContains(response, 'Linear equations')
+
+    def test_not_enrolled(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('student_course_detail', args=[self.course.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class StudentCourseFragmentTest(CourseTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user('other', password='password')
+        cls.course.students.add(cls.other)
+
+    def get(self, user):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('student_course_detail', args=[self.course.id]))
+        return response, len(queries)
+
+    def test_shared_by_students(self):
+        response, queries = self.get(self.student)
+        # the fragments rendered for one student are served to the others
+        other_response, other_queries = self.get(self.other)
+        self.assertLess(other_queries, queries)
+        self.assertEqual(other_response.content, response.content)
+
+    def test_course_changed(self):
+        self.get(self.student)
+        # TestCase never commits, the versions are bumped right away instead
+        with mock.patch('django.db.transaction.on_commit', lambda func: func()):
+            Module.objects.create(course=self.course, title='Quadratic equations')
+        response, queries = self.get(self.other)
+        self.assertContains(response, 'Quadratic equations')
+
+
+class ModuleContentsFragmentTest(CourseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.student)
+        self.other_module = Module.objects.create(course=self.course, title='Quadratic equations')
+        self.url = reverse('student_course_detail_module', args=[self.course.id, self.module.id])
+
+    def get(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, len(queries)
+
+    def test_module_version(self):
+        response, queries = self.get()
+        warm_response, warm_queries = self.get()
+        self.assertLess(warm_queries, queries)
+        # TestCase never commits, the versions are bumped right away instead
+        with mock.patch('django.db.transaction.on_commit', lambda func: func()):
+            # a change to another module of the course keeps the contents of this one,
+            # only the list of modules is rendered again
+            Content.objects.create(module=self.other_module,
+                                   item=Text.objects.create(owner=self.owner, title='Squares', content=''))
+            response, queries = self.get()
+            self.assertEqual(queries, warm_queries + 1)
+            self.assertNotContains(response, 'Squares')
+            # one of its items changes it
+            text = Text.objects.get(title='Introduction')
+            text.title = 'Overview'
+            text.save()
+        response, queries = self.get()
+        self.assertContains(response, 'Overview')
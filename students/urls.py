@@ -1,16 +1,16 @@
+from django.conf import settings
 from django.urls import path
-from django.views.decorators.cache import cache_page
-from . import views
+from . import views, async_views
+
+# the async view is used when settings.ASYNC_VIEWS is on
+course_detail_view = async_views.student_course_detail if settings.ASYNC_VIEWS \
+    else views.StudentCourseDetailView.as_view()
 
 
 urlpatterns = [
     path('register/', views.StudentRegistrationView.as_view(), name='student_registration'),
     path('enroll-course/', views.StudentEnrollCourseView.as_view(), name='student_enroll_course'),
     path('courses/', views.StudentCourseListView.as_view(), name='student_course_list'),
-    path('course/<pk>/',
-        cache_page(60 * 15)(views.StudentCourseDetailView.as_view()),
-        name='student_course_detail'),
-    path('course/<pk>/<module_id>/',
-        cache_page(60 * 15)(views.StudentCourseDetailView.as_view()),
-        name='student_course_detail_module'),
+    path('course/<pk>/', course_detail_view, name='student_course_detail'),
+    path('course/<pk>/<module_id>/', course_detail_view, name='student_course_detail_module'),
 ]
\ No newline at end of file
@@ -5,7 +5,13 @@ from django.views.generic.detail import DetailView
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.conf import settings
+from django.http import Http404
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import never_cache
+from educa.routers import replica_reads
 from courses.models import Course
+from courses.caching import get_enrolled_course_ids, is_enrolled, course_version_key, module_version_key, get_version
 from .forms import CourseEnrollForm
 
 # This will allow student registration on site
@@ -45,25 +51,42 @@ class StudentCourseListView(LoginRequiredMixin, ListView):
     # this query will retrieve only courses that student is enrolled on
     def get_queryset(self):
         qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+        return qs.filter(id__in=get_enrolled_course_ids(self.request.user))
 
 
+# the page is rendered for every request, so the enrollment check always runs.
+# The course-wide parts are cached as template fragments shared by all enrolled students
+@method_decorator(never_cache, name='dispatch')
+@method_decorator(replica_reads, name='dispatch')
 class StudentCourseDetailView(DetailView):
     model = Course
     template_name = 'students/course/detail.html'
+    # session, user, enrollments, course, module, modules and contents,
+    # then the items and content type of each of the 4 item models
+    query_budget = 15
 
-    def get_queryset(self):
-        qs = super().get_queryset()
-        return qs.filter(students__in=[self.request.user])
+    # check the cached enrollments first, so the course is fetched without joining its students
+    def get_object(self, queryset=None):
+        if not is_enrolled(self.request.user, self.kwargs.get(self.pk_url_kwarg)):
+            raise Http404('No course found matching the query')
+        return super().get_object(queryset)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # get course object
-        course = self.get_object()
+        # course object already fetched by get()
+        course = self.object
         if 'module_id' in self.kwargs:
             # get current module
             context['module'] = course.modules.get(id=self.kwargs['module_id'])
         else:
             # get first module
             context['module'] = course.modules.all()[0]
+        # contents with their items batched by content type, only evaluated
+        # when the cached module contents fragment has to be rendered
+        context['contents'] = context['module'].contents.with_items()
+        # the modules fragment is keyed by the course version, which changes with any edit to the course,
+        # the contents fragment by the version of the module, so edits to other modules keep it
+        context['course_version'] = get_version(course_version_key(course.id))
+        context['module_version'] = get_version(module_version_key(context['module'].id))
+        context['fragment_timeout'] = settings.COURSE_FRAGMENT_CACHE_TIMEOUT
         return context
\ No newline at end of file